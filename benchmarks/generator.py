@@ -0,0 +1,72 @@
+"""
+Generator of synthetic markdown repositories for benchmarks, identical for
+the same parameters and seed.
+"""
+import pathlib
+import random
+
+WORDS = ("translation markdown repository block paragraph version content "
+         "update language file folder source title section example link code "
+         "list table hash cache render convert standard document").split()
+
+def sentence(rng, links=0.0, words=12):
+    """ Sentence of random words, with a link at the probability links. """
+    text = " ".join(rng.choice(WORDS) for _ in range(words)).capitalize()
+    if rng.random() < links:
+        target = "/".join(rng.choice(WORDS) for _ in range(2))
+        text += f" [{rng.choice(WORDS)}](/{target}.md)"
+    return text + "."
+
+def block(rng, links=0.2, code=0.1):
+    """ Random markdown block: paragraph, title, list or code. """
+    if rng.random() < code:
+        lines = (f"{rng.choice(WORDS)} = {rng.randint(0, 100)}" for _ in range(4))
+        return "```python\n" + "\n".join(lines) + "\n```"
+    kind = rng.random()
+    if kind < 0.15:
+        return "#" * rng.randint(1, 3) + " " + sentence(rng, words=4)
+    if kind < 0.3:
+        return "\n".join("- " + sentence(rng, links, words=6) for _ in range(3))
+    return " ".join(sentence(rng, links) for _ in range(rng.randint(1, 4)))
+
+def document(rng, blocks=20, links=0.2, code=0.1, duplication=0.1, shared=()):
+    """ Markdown document, with blocks duplicated from shared ones. """
+    content = []
+    for _ in range(blocks):
+        if shared and rng.random() < duplication:
+            content.append(rng.choice(shared))
+        else:
+            content.append(block(rng, links, code))
+    return "\n\n".join(content) + "\n"
+
+def generate_repository(folder, files=50, blocks=20, links=0.2, code=0.1,
+                        duplication=0.1, depth=3, seed=0):
+    """
+    Write a repository of markdown files into a folder, in subfolders up to
+    depth levels. Return relative paths of generated files.
+
+    links and code are the probabilities of a link in a sentence and of a
+    code block. duplication is the ratio of blocks repeated between files.
+    """
+    rng = random.Random(seed)
+    folder = pathlib.Path(folder)
+    shared = [block(rng, links, code) for _ in range(max(1, blocks))]
+
+    paths = []
+    for index in range(files):
+        parts = [f"section{rng.randint(0, 4)}" for _ in range(rng.randint(0, depth))]
+        path = pathlib.Path(*parts, f"page{index}.md")
+        (folder / path).parent.mkdir(parents=True, exist_ok=True)
+        (folder / path).write_text(
+                document(rng, blocks, links, code, duplication, shared))
+        paths.append(path)
+    return paths
+
+def modify_repository(folder, paths, ratio=0.1, seed=1):
+    """ Append a block to a ratio of the files, as a new version. """
+    rng = random.Random(seed)
+    modified = rng.sample(list(paths), max(1, int(len(paths) * ratio)))
+    for path in modified:
+        with open(pathlib.Path(folder) / path, "a") as file:
+            file.write("\n" + block(rng) + "\n")
+    return modified
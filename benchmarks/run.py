@@ -0,0 +1,242 @@
+"""
+Benchmarks of the translation pipeline on a synthetic repository, without
+translator calls (see generator.py).
+
+Run from the repository root:
+    python -m benchmarks.run --files 50 --output results.json
+    python -m benchmarks.run --compare results.json
+
+Results are written as JSON with sorted keys, durations in seconds, to be
+compared between commits with the same parameters.
+"""
+import argparse
+import json
+import pathlib
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import mistletoe
+from markdown_translator import Markdown, RepositoryTranslator, config
+from markdown_translator import markdown, renderers
+from markdown_translator.adapters import BlockHashesJSONAdapter, BlockHashesSQLAdapter
+from .generator import generate_repository, modify_repository
+
+FORMAT_VERSION = 1
+BENCHMARKS = {}
+
+def benchmark(function):
+    """
+    Register a benchmark, called with the context to get the measured function,
+    or a (setup, function) pair: setup runs before each repetition, out of the
+    measure, and its result is given to the function. A function returning a
+    duration in seconds measures itself.
+    """
+    BENCHMARKS[function.__name__] = function
+    return function
+
+def clear_caches():
+    """ Measure cold runs, without results of previous repetitions. """
+    markdown.parsed_chunks.clear()
+    markdown.standardized_chunks.clear()
+    renderers._html_fragments.clear()
+
+class Context:
+    """ Synthetic repository and settings shared by benchmarks. """
+    def __init__(self, folder, parameters):
+        self.folder = pathlib.Path(folder)
+        self.source = self.folder / "source"
+        self.paths = generate_repository(self.source, **parameters)
+        self.texts = [(self.source / path).read_text() for path in self.paths]
+        self.settings = config.snapshot(
+                translation_engine="disabled",
+                versioning="json",
+                source_lang="en",
+                dest_lang=["fr"],
+                include_files=[],
+                exclude_files=[],
+                keep_clean=False,
+                verbose=False,
+                report_path="",
+                profile_path="",
+                progress="disabled",
+                metrics_path="",
+                )
+
+    def temporary(self, name):
+        """ Empty folder for a repetition. """
+        path = self.folder / name
+        shutil.rmtree(path, ignore_errors=True)
+        path.mkdir()
+        return path
+
+@benchmark
+def import_time(context):
+    """ Cumulative import time of the package, in a new interpreter. """
+    def run():
+        result = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", "import markdown_translator"],
+                capture_output=True, text=True, check=True)
+        # Lines as "import time: self [us] | cumulative | imported package"
+        for line in result.stderr.splitlines()[1:]:
+            _, cumulative, package = line.split("|")
+            if package.strip() == "markdown_translator":
+                return int(cumulative) / 1e6
+    return run
+
+@benchmark
+def parse(context):
+    def run():
+        for text in context.texts:
+            Markdown(text, settings=context.settings)
+    return run
+
+@benchmark
+def standardize(context):
+    def run():
+        for text in context.texts:
+            Markdown(text, settings=context.settings).standardize()
+    return run
+
+@benchmark
+def link_editing(context):
+    source_md = Markdown(settings=context.settings)
+    def setup():
+        # Links are edited in place, documents are parsed for each repetition
+        with renderers.mistletoe_lock:
+            return [mistletoe.Document(text) for text in context.texts]
+    def run(documents):
+        for document in documents:
+            source_md._edit_ast_links(document, "fr")
+    return setup, run
+
+@benchmark
+def blocks_diff_merge(context):
+    old_versions = [Markdown(text, settings=context.settings) for text in context.texts]
+    new_versions = [Markdown(text + "\nNew paragraph.\n", settings=context.settings)
+                        for text in context.texts]
+    def run():
+        for old_md, new_md in zip(old_versions, new_versions):
+            new_md.blocks - old_md.blocks
+            new_blocks = new_md.blocks.copy()
+            new_blocks.pick_translations(old_md.blocks)
+    return run
+
+def hashes_store(context, adapter_class):
+    entries = {str(path): Markdown(text, settings=context.settings).blocks.hashes
+                    for path, text in zip(context.paths, context.texts)}
+    def setup():
+        return context.temporary(adapter_class.__name__)
+    def run(folder):
+        store = adapter_class(folder)
+        for file_name, hashes in entries.items():
+            store.set(file_name, hashes)
+        for file_name in entries:
+            store.get(file_name)
+    return setup, run
+
+@benchmark
+def hashes_json(context):
+    return hashes_store(context, BlockHashesJSONAdapter)
+
+@benchmark
+def hashes_sql(context):
+    return hashes_store(context, BlockHashesSQLAdapter)
+
+@benchmark
+def repository_update(context):
+    def setup():
+        return context.temporary("destination")
+    def run(destination):
+        RepositoryTranslator(context.source, destination, context.settings).update()
+    return setup, run
+
+@benchmark
+def repository_update_incremental(context):
+    destination = context.temporary("incremental")
+    RepositoryTranslator(context.source, destination, context.settings).update()
+    modified_source = context.folder / "modified"
+    shutil.rmtree(modified_source, ignore_errors=True)
+    shutil.copytree(context.source, modified_source)
+    modify_repository(modified_source, context.paths)
+    def setup():
+        repetition = context.temporary("incremental_run")
+        shutil.copytree(destination, repetition, dirs_exist_ok=True)
+        return repetition
+    def run(repetition):
+        RepositoryTranslator(modified_source, repetition, context.settings).update()
+    return setup, run
+
+def measure(function, repeat):
+    """ Durations of repetitions of a benchmark function, without its setup. """
+    setup = None
+    if isinstance(function, tuple):
+        setup, function = function
+    durations = []
+    for _ in range(repeat):
+        clear_caches()
+        arguments = () if setup is None else (setup(),)
+        start = time.perf_counter()
+        duration = function(*arguments)
+        durations.append(time.perf_counter() - start if duration is None else duration)
+    return {
+        "repeat": repeat,
+        "min": min(durations),
+        "median": statistics.median(durations),
+        "mean": statistics.mean(durations),
+    }
+
+def run_benchmarks(names, parameters, repeat):
+    with tempfile.TemporaryDirectory() as folder:
+        context = Context(folder, parameters)
+        return {name: measure(BENCHMARKS[name](context), repeat) for name in names}
+
+def compare(results, baseline):
+    """ Print median durations against a baseline, slower ratios above 1. """
+    if baseline["parameters"] != results["parameters"]:
+        print("Warning: baseline generated with other parameters", file=sys.stderr)
+    print(f"{'benchmark':<32}{'baseline':>12}{'current':>12}{'ratio':>8}")
+    for name, stats in results["results"].items():
+        if name not in baseline["results"]:
+            continue
+        reference = baseline["results"][name]["median"]
+        ratio = f"{stats['median'] / reference:>8.2f}" if reference else f"{'-':>8}"
+        print(f"{name:<32}{reference:>12.4f}{stats['median']:>12.4f}{ratio}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of markdown_translator.")
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--blocks", type=int, default=20)
+    parser.add_argument("--links", type=float, default=0.2)
+    parser.add_argument("--code", type=float, default=0.1)
+    parser.add_argument("--duplication", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS),
+                        default=list(BENCHMARKS))
+    parser.add_argument("--output", default=None, help="JSON file of results")
+    parser.add_argument("--compare", default=None, help="JSON file of a baseline")
+    arguments = parser.parse_args()
+
+    parameters = {name: getattr(arguments, name)
+                    for name in ("files", "blocks", "links", "code", "duplication", "seed")}
+    results = {
+        "format": FORMAT_VERSION,
+        "python": platform.python_version(),
+        "parameters": parameters,
+        "results": run_benchmarks(arguments.only, parameters, arguments.repeat),
+    }
+
+    output = json.dumps(results, indent=4, sort_keys=True)
+    if arguments.output:
+        pathlib.Path(arguments.output).write_text(output + "\n")
+    else:
+        print(output)
+    if arguments.compare:
+        compare(results, json.loads(pathlib.Path(arguments.compare).read_text()))
+
+if __name__ == "__main__":
+    main()
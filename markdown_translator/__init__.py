@@ -1,3 +1,11 @@
-from .markdown import Markdown
-from .repository_translator import RepositoryTranslator
 from .configuration import config
+
+def __getattr__(name):
+    """ Import translation classes and their dependencies on first use. """
+    if name == "Markdown":
+        from .markdown import Markdown
+        return Markdown
+    if name == "RepositoryTranslator":
+        from .repository_translator import RepositoryTranslator
+        return RepositoryTranslator
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,6 +1,8 @@
 from .adapters_manager import AdaptersManager
 from .hashes_adapters import *
 from .translators import *
+from .schedulers import *
+from .progress_sinks import *
 from ..configuration import config
 
 hashes_adapters_collection = {
@@ -14,6 +16,18 @@ translator_adapters_collection = {
     "disabled": translate_disabled,
 }
 
+scheduler_adapters_collection = {
+    "files": schedule_files,
+    "recent": schedule_recent,
+    "smallest": schedule_smallest,
+}
+
+progress_sinks_collection = {
+    "bar": progress_bar,
+    "log": progress_log,
+    "disabled": progress_disabled,
+}
+
 hashes = AdaptersManager(
     adapters=hashes_adapters_collection,
     config_var="VERSIONING"
@@ -23,3 +37,13 @@ translator = AdaptersManager(
     adapters=translator_adapters_collection,
     config_var="TRANSLATION_ENGINE"
     )
+
+scheduler = AdaptersManager(
+    adapters=scheduler_adapters_collection,
+    config_var="SCHEDULING"
+    )
+
+progress = AdaptersManager(
+    adapters=progress_sinks_collection,
+    config_var="PROGRESS"
+    )
@@ -19,26 +19,27 @@ class AdaptersManager:
         self._adapter = None
         self._selected = None
         self._config_var = config_var
-
-        # Require an existing adapter as default.
-        default = getattr(config, self._config_var)
-        self.select(default)
+        # Configured adapter is selected on first use
 
     def select(self, name, *args, **kwargs):
         """
         Change the adapter used by the manager, with the ability to pass
         arguments for the instantiation of an adapter class.
         """
+        self._adapter = self.adapter(name)
         name = name.lower()
-        if name not in self._adapters_list:
-            raise Exception(f"Adapter: '{name}' not in {self.options}.")
-
         config(**{self._config_var: name})
         self._selected = name
-        self._adapter = self._adapters_list[name]
         if inspect.isclass(self._adapter):
             self._adapter = self._adapter(*args, **kwargs)
 
+    def adapter(self, name):
+        """ Get an adapter class or function without selecting it. """
+        name = name.lower()
+        if name not in self._adapters_list:
+            raise Exception(f"Adapter: '{name}' not in {self.options}.")
+        return self._adapters_list[name]
+
     @property
     def options(self):
         """ Find available adapters. """
@@ -1,6 +1,16 @@
+import contextlib
 import json
+import os
 import pathlib
-import sqlite3
+import threading
+from ..files import defer_write, read_json, update_json
+from ..instrumentation import stage
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
 
 class BlockHashesAdapter:
     """
@@ -21,63 +31,277 @@ class BlockHashesAdapter:
     def delete(self, file_name):
         return None
 
+    def delete_many(self, file_names):
+        return None
+
+    def set_many(self, entries):
+        """ Store hashes of several files, as a dict of file names. """
+        return None
+
+    def items(self):
+        """ List stored (file name, hashes) pairs. """
+        return []
+
+    def set_sentences(self, lang, translations):
+        """ Store translations of sentences, as a dict of sentence hashes. """
+        return None
+
+    def get_sentence(self, lang, sentence_hash):
+        return None
+
+    def sentences_items(self):
+        """ List stored (language, translations of sentences) pairs. """
+        return []
+
+    def prune_sentences(self, sentence_hashes):
+        """ Delete translations of sentences missing from sentence_hashes. """
+        return None
+
 class BlockHashesJSONAdapter(BlockHashesAdapter):
+    """
+    Hashes stored in a JSON file, which can be shared by concurrent processes:
+    changes are merged key by key into the file content, under lock. Changes
+    made during bulk_writes are merged once, at its end.
+    """
     def __init__(self, folder="."):
         self.filename = pathlib.Path(folder) / f"hashes.json"
-        if self.filename.exists():
-            self.data = json.loads(self.filename.read_text(encoding="utf-8"))
-        else:
-            self.data = {}
+        with stage("hashes.read", store="json", bytes=_file_size(self.filename)):
+            self.data = read_json(self.filename, default={})
+        self.sentences_filename = pathlib.Path(folder) / "sentences.json"
+        self.sentences = None
+        # Changes not merged into the files yet, None values being deleted,
+        # and sentences kept by a pruning
+        self.changes = {}
+        self.sentences_changes = {}
+        self.sentences_kept = None
+        self.lock = threading.Lock()
 
     def set(self, file_name, hashes):
-        self.data[str(file_name)] = hashes
-        self._save()
+        self._save({str(file_name): hashes})
 
     def get(self, file_name):
-        return self.data.get(str(file_name), None)
+        with self.lock:
+            if str(file_name) in self.changes:
+                return self.changes[str(file_name)]
+            return self.data.get(str(file_name), None)
 
     def delete(self, file_name):
-        file_name = str(file_name)
-        if file_name in self.data:
-            del self.data[file_name]
-            self._save()
+        self.delete_many([file_name])
+
+    def delete_many(self, file_names):
+        # Files may have been stored by another process since loaded
+        if deleted := {str(file_name): None for file_name in file_names}:
+            self._save(deleted)
+
+    def set_many(self, entries):
+        self._save({str(file_name): hashes for file_name, hashes in entries.items()})
+
+    def items(self):
+        with self.lock:
+            data = {**self.data, **self.changes}
+        return [(file_name, hashes) for file_name, hashes in data.items()
+                    if hashes is not None]
+
+    def set_sentences(self, lang, translations):
+        with self.lock:
+            self.sentences_changes.setdefault(lang, {}).update(translations)
+        self._save_sentences()
+
+    def get_sentence(self, lang, sentence_hash):
+        with self.lock:
+            if (translation := self.sentences_changes.get(lang, {}).get(sentence_hash)):
+                return translation
+        return self._load_sentences().get(lang, {}).get(sentence_hash, None)
+
+    def sentences_items(self):
+        sentences = {lang: dict(translations)
+                        for lang, translations in self._load_sentences().items()}
+        with self.lock:
+            self._merge_sentences(sentences)
+        return list(sentences.items())
+
+    def prune_sentences(self, sentence_hashes):
+        with self.lock:
+            self.sentences_kept = set(sentence_hashes)
+        self._save_sentences()
 
-    def _save(self):
-        with self.filename.open('w', encoding="utf-8") as file:
-            json.dump(self.data, file, indent=4)
+    def _load_sentences(self):
+        """ Sentences are loaded on demand, only used with SPLIT_SENTENCES. """
+        if self.sentences is None:
+            with stage("hashes.read", store="json",
+                            bytes=_file_size(self.sentences_filename)):
+                self.sentences = read_json(self.sentences_filename, default={})
+        return self.sentences
+
+    def _save_sentences(self):
+        if not defer_write((self, "sentences"), self._write_sentences):
+            self._write_sentences()
+
+    def _write_sentences(self):
+        with self.lock, stage("hashes.write", store="json") as measured:
+            if self.sentences_changes or self.sentences_kept is not None:
+                self.sentences = update_json(self.sentences_filename, self._merge_sentences)
+                measured.add(bytes=_file_size(self.sentences_filename))
+                self.sentences_changes, self.sentences_kept = {}, None
+
+    def _merge_sentences(self, sentences):
+        """ Apply pending sentences changes to stored ones, under lock. """
+        for lang, translations in self.sentences_changes.items():
+            sentences.setdefault(lang, {}).update(translations)
+        if self.sentences_kept is not None:
+            for lang, translations in sentences.items():
+                sentences[lang] = {sentence_hash: translation
+                                    for sentence_hash, translation in translations.items()
+                                        if sentence_hash in self.sentences_kept}
+
+    def _save(self, changes):
+        """ Merge changed hashes into the file, None values being deleted. """
+        with self.lock:
+            self.changes.update(changes)
+        if not defer_write(self, self._write):
+            self._write()
+
+    def _write(self):
+        def merge_changes(data):
+            for file_name, hashes in self.changes.items():
+                if hashes is None:
+                    data.pop(file_name, None)
+                else:
+                    data[file_name] = hashes
+        with self.lock, stage("hashes.write", store="json") as measured:
+            if self.changes:
+                self.data = update_json(self.filename, merge_changes)
+                measured.add(bytes=_file_size(self.filename))
+                self.changes = {}
+
+# Seconds to wait for a database locked by another process
+BUSY_TIMEOUT = 30
+
+UPSERT_HASHES = """
+    INSERT INTO hashes (file_name, hash_values) VALUES (?, ?)
+    ON CONFLICT (file_name) DO UPDATE SET hash_values = excluded.hash_values
+"""
 
 class BlockHashesSQLAdapter(BlockHashesAdapter):
     def __init__(self, folder="."):
+        import sqlite3
         self.dbname = pathlib.Path(folder) / "hashes.db"
-        self.conn = sqlite3.connect(str(self.dbname))
+        # Shared with threads of watch mode, transactions are serialized by
+        # the lock. Concurrent processes wait up to the timeout for writes.
+        self.conn = sqlite3.connect(
+                str(self.dbname),
+                check_same_thread=False,
+                timeout=BUSY_TIMEOUT,
+                isolation_level=None,
+                )
+        self.lock = threading.Lock()
         self._initialize_db()
 
+    @contextlib.contextmanager
+    def _transaction(self, rows=()):
+        """
+        Write transaction locking the database from its start, to wait for
+        other writers instead of failing when upgrading a read lock. Bytes
+        of the text values of rows written are reported.
+        """
+        size = sum(len(value) for row in rows for value in row if isinstance(value, str))
+        with self.lock, stage("hashes.write", store="sql", bytes=size):
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+
     def _initialize_db(self):
-        with self.conn:
+        with self._transaction():
             self.conn.execute("""
                 CREATE TABLE IF NOT EXISTS hashes (
                     file_name TEXT PRIMARY KEY,
                     hash_values TEXT
                 )
             """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS sentences (
+                    lang TEXT,
+                    sentence_hash TEXT,
+                    translation TEXT,
+                    PRIMARY KEY (lang, sentence_hash)
+                )
+            """)
 
     def set(self, file_name, hashes):
-        with self.conn:
-            self.conn.execute("""
-                INSERT OR REPLACE INTO hashes (file_name, hash_values)
-                VALUES (?, ?)
-            """, (str(file_name), json.dumps(hashes)))
+        row = (str(file_name), json.dumps(hashes))
+        with self._transaction([row]):
+            self.conn.execute(UPSERT_HASHES, row)
 
     def get(self, file_name):
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT hash_values FROM hashes WHERE file_name = ?
-        """, (str(file_name),))
-        result = cursor.fetchone()
+        with stage("hashes.read", store="sql") as measured:
+            cursor = self.conn.execute("""
+                SELECT hash_values FROM hashes WHERE file_name = ?
+            """, (str(file_name),))
+            result = cursor.fetchone()
+            measured.add(bytes=len(result[0]) if result else 0)
         return json.loads(result[0]) if result else None
 
     def delete(self, file_name):
-        with self.conn:
+        with self._transaction():
             self.conn.execute("""
                 DELETE FROM hashes WHERE file_name = ?
             """, (str(file_name),))
+
+    def delete_many(self, file_names):
+        with self._transaction():
+            self.conn.executemany("""
+                DELETE FROM hashes WHERE file_name = ?
+            """, [(str(file_name),) for file_name in file_names])
+
+    def set_many(self, entries):
+        rows = [(str(file_name), json.dumps(hashes)) for file_name, hashes in entries.items()]
+        with self._transaction(rows):
+            self.conn.executemany(UPSERT_HASHES, rows)
+
+    def items(self):
+        cursor = self.conn.execute("""
+            SELECT file_name, hash_values FROM hashes
+        """)
+        return [(file_name, json.loads(hashes)) for file_name, hashes in cursor]
+
+    def set_sentences(self, lang, translations):
+        rows = [(lang, hash, text) for hash, text in translations.items()]
+        with self._transaction(rows):
+            self.conn.executemany("""
+                INSERT INTO sentences (lang, sentence_hash, translation)
+                VALUES (?, ?, ?)
+                ON CONFLICT (lang, sentence_hash) DO UPDATE
+                SET translation = excluded.translation
+            """, rows)
+
+    def get_sentence(self, lang, sentence_hash):
+        with stage("hashes.read", store="sql") as measured:
+            cursor = self.conn.execute("""
+                SELECT translation FROM sentences WHERE lang = ? AND sentence_hash = ?
+            """, (lang, sentence_hash))
+            result = cursor.fetchone()
+            measured.add(bytes=len(result[0]) if result else 0)
+        return result[0] if result else None
+
+    def prune_sentences(self, sentence_hashes):
+        kept = set(sentence_hashes)
+        stored = self.conn.execute("""
+            SELECT DISTINCT sentence_hash FROM sentences
+        """).fetchall()
+        with self._transaction():
+            self.conn.executemany("""
+                DELETE FROM sentences WHERE sentence_hash = ?
+            """, [row for row in stored if row[0] not in kept])
+
+    def sentences_items(self):
+        sentences = {}
+        cursor = self.conn.execute("""
+            SELECT lang, sentence_hash, translation FROM sentences
+        """)
+        for lang, sentence_hash, translation in cursor:
+            sentences.setdefault(lang, {})[sentence_hash] = translation
+        return list(sentences.items())
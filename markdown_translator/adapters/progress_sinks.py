@@ -0,0 +1,48 @@
+import datetime
+import logging
+import sys
+
+logger = logging.getLogger("markdown_translator.progress")
+
+def _duration(seconds):
+    if seconds is None:
+        return "?"
+    return str(datetime.timedelta(seconds=round(seconds)))
+
+def _percent(done, total):
+    return done / total * 100 if total else 100.0
+
+def progress_bar(progress, stream=None, width=30):
+    """ Single terminal line of the update, rewritten on each report. """
+    stream = stream or sys.stderr
+    files, files_done = progress.total("files"), progress.total("files_done")
+    characters = progress.total("characters")
+    characters_done = progress.total("characters_done")
+    ratio = characters_done / characters if characters else \
+                (files_done / files if files else 1.0)
+    filled = int(ratio * width)
+    languages = " ".join(
+            f"{lang} {_percent(language.files_done, language.files):.0f}%"
+            for lang, language in progress.languages.items())
+    stream.write(f"\r[{'#' * filled}{'-' * (width - filled)}] {ratio:.0%} "
+                 f"{files_done}/{files} files, {characters_done}/{characters} characters, "
+                 f"ETA {_duration(progress.eta)} ({languages})")
+    if progress.finished:
+        stream.write(f"\nDone in {_duration(progress.elapsed)}\n")
+    stream.flush()
+
+def progress_log(progress):
+    """ Log line per language, on the markdown_translator.progress logger. """
+    for lang, language in progress.languages.items():
+        throughput = language.throughput
+        logger.info(
+            "%s: %d/%d files, %d/%d blocks, %d/%d characters, %s characters/s, ETA %s",
+            lang, language.files_done, language.files,
+            language.blocks_done, language.blocks,
+            language.characters_done, language.characters,
+            f"{throughput:.0f}" if throughput else "?", _duration(language.eta))
+    if progress.finished:
+        logger.info("Update done in %s", _duration(progress.elapsed))
+
+def progress_disabled(progress):
+    """ No progress reporting, the update is not tracked. """
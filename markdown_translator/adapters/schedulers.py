@@ -0,0 +1,40 @@
+from ..configuration import config
+from ..paths import PathsMatcher
+
+def schedule_files(units):
+    """ Keep translation units in files discovery order. """
+    return list(units)
+
+def schedule_recent(units):
+    """ Translate first files modified recently, deleted ones last. """
+    def modified(unit):
+        try:
+            return unit.file_plan.path.stat().st_mtime
+        except FileNotFoundError:
+            return float("-inf")
+    return sorted(units, key=lambda unit: -modified(unit))
+
+def schedule_smallest(units):
+    """ Translate first smallest modifications, maximizing translated files. """
+    return sorted(units, key=lambda unit: unit.characters)
+
+def prioritize(units, settings=config):
+    """
+    Move first units of PRIORITY_FILES and PRIORITY_LANGS, in order of the
+    lists, keeping the scheduler order otherwise.
+    """
+    if not settings.PRIORITY_FILES and not settings.PRIORITY_LANGS:
+        return units
+
+    matchers = [PathsMatcher([pattern]) for pattern in settings.PRIORITY_FILES]
+    def file_rank(unit):
+        parts = unit.file_plan.relative_source.parts
+        return next((rank for rank, matcher in enumerate(matchers)
+                        if matcher.match(parts)), len(matchers))
+
+    langs = [lang.lower() for lang in settings.PRIORITY_LANGS]
+    def lang_rank(unit):
+        lang = unit.lang.lower()
+        return langs.index(lang) if lang in langs else len(langs)
+
+    return sorted(units, key=lambda unit: (file_rank(unit), lang_rank(unit)))
@@ -1,26 +1,30 @@
-import requests
 from ..configuration import config
+from ..instrumentation import stage
 from ..exceptions import MarkdownTranslatorError
 
-def translate_deepl(html_content, lang_to, lang_from=None):
+def translate_deepl(html_content, lang_to, lang_from=None, settings=config):
     """
     Translate HTML content using DeepL API. See API documentation for available
     languages : https://www.deepl.com/fr/docs-api/translate-text/
 
     DeepL can't convert raw markdown, it will break syntax and text translation.
     """
+    import requests
     endpoint = "https://api-free.deepl.com/v2/translate"
     headers = {
         "Content-Type": "application/x-www-form-urlencoded",
     }
     data = {
-        "auth_key": config.API_KEY,
+        "auth_key": settings.API_KEY,
         "text": html_content,
         "source_lang": lang_from,
         "target_lang": lang_to,
         "tag_handling": "html",
     }
-    response = requests.post(endpoint, headers=headers, data=data)
+    with stage("translator.request", engine="deepl") as request:
+        response = requests.post(endpoint, headers=headers, data=data)
+        if request is not None:
+            request.details["status"] = response.status_code
 
     if response.status_code != 200:
         error_msg = f"HTTP Error {response.status_code} on DeepL API"
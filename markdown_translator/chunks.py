@@ -0,0 +1,105 @@
+import hashlib
+import re
+import threading
+import zlib
+
+# Lines continuing a previous block after a blank line: indented content,
+# list items of a loose list, code fences.
+CONTINUATION = re.compile(r'\s|[*+-]\s|\d+[.)]\s')
+FENCE = re.compile(r'[ \t]*(`{3,}|~{3,})(.*)')
+
+def code_fence(fence, line):
+    """
+    Opening fence of the code block containing the line after it, None
+    outside of code blocks. As in CommonMark, a code block is closed only by
+    a fence of the same character, at least as long as the opening one.
+    """
+    if (match := FENCE.match(line)) is None:
+        return fence
+    marker, rest = match.groups()
+    if fence is None:
+        # Backticks in the info string make an inline code span
+        return None if marker[0] == "`" and "`" in rest else marker
+    if marker[0] == fence[0] and len(marker) >= len(fence) and not rest.strip():
+        return None
+    return fence
+
+def split_chunks(text, mask=0xF, min_size=512, max_size=65536):
+    """
+    Cut a markdown text into content-defined chunks, which concatenation
+    gives back the text.
+
+    Chunks end on blank lines between top-level blocks, where a window hash
+    of the last line of the block matches the mask: an edit moves only the
+    boundaries around it. Once max_size is reached, a chunk ends at the next
+    blank line between blocks.
+    """
+    chunks = []
+    start = size = 0
+    fence = None
+    previous_line = ""
+    lines = text.splitlines(keepends=True)
+    for index, line in enumerate(lines):
+        size += len(line)
+        fence = code_fence(fence, line)
+        if fence or line.strip() or not previous_line.strip():
+            previous_line = line
+            continue
+
+        next_line = lines[index + 1] if index + 1 < len(lines) else ""
+        window_hash = zlib.crc32(previous_line.encode())
+        previous_line = line
+        if size < min_size or CONTINUATION.match(next_line):
+            continue
+        if window_hash & mask == 0 or size >= max_size:
+            chunks.append("".join(lines[start:index + 1]))
+            start, size = index + 1, 0
+
+    if start < len(lines):
+        chunks.append("".join(lines[start:]))
+    return chunks
+
+class ChunksCache:
+    """
+    Results computed from chunks of markdown texts, stored by chunk digest to
+    compute again only modified chunks.
+    """
+    def __init__(self, limit=10000):
+        self.results = {}
+        self.limit = limit
+        # Results are set only when missing from the cache, counters being
+        # incremented by concurrent threads
+        self.lookups = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, chunk, compute, *key):
+        """ Retrieve a chunk result, computed by compute(chunk) if missing. """
+        with self.lock:
+            self.lookups += 1
+        digest = self._digest(chunk, key)
+        if (result := self.results.get(digest)) is None:
+            result = compute(chunk)
+            self.set(chunk, result, *key)
+        return result
+
+    def set(self, chunk, result, *key):
+        with self.lock:
+            self.misses += 1
+        if len(self.results) >= self.limit:
+            self.results.clear()
+        self.results[self._digest(chunk, key)] = result
+
+    def has(self, chunk, *key):
+        return self._digest(chunk, key) in self.results
+
+    def clear(self):
+        self.results.clear()
+
+    def counters(self):
+        with self.lock:
+            return {"lookups": self.lookups, "misses": self.misses}
+
+    @staticmethod
+    def _digest(chunk, key):
+        return (hashlib.md5(chunk.encode()).digest(), *key)
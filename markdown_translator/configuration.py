@@ -1,4 +1,4 @@
-import configparser
+import functools
 import os
 import sys
 from .exceptions import MarkdownTranslatorError
@@ -8,9 +8,13 @@ class Configuration:
     Interface for dynamic configuration of the module, allowing settings from
     various entries: configure method, ini file or/and environment variables.
 
+    Settings are loaded on first use, to import the module without parsing
+    the ini file and the environment.
+
     Friendly reminder: never share confidential crendentials online!
     """
-    def __init__(self):
+    def _load(self):
+        super().__setattr__('_loaded', True)
         # Default configuration settings
         self.API_KEY = ""
         self.TRANSLATION_ENGINE = "deepl"
@@ -20,8 +24,41 @@ class Configuration:
         # Available versioning method (see adapters) : json, sql.
         self.VERSIONING = "disabled"
 
+        # Parse and standardize again only modified chunks of files (see chunks.py)
+        self.INCREMENTAL_PARSING = False
+        # Files larger than STREAM_SIZE bytes are read and standardized block by
+        # block, 0 to disable. Their blocks are still all kept in memory.
+        self.STREAM_SIZE = 0
+
+        # Limits of repository updates, postponing remaining translations:
+        # characters sent to the translator and seconds, 0 for no limit.
+        self.CHARACTERS_BUDGET = 0
+        self.TIME_BUDGET = 0
+        # Order of translations (see adapters) : files, recent, smallest.
+        # Priority files and languages are translated first, in list order.
+        self.SCHEDULING = "files"
+        self.PRIORITY_FILES = []
+        self.PRIORITY_LANGS = []
+        # Split updates between SHARD_COUNT workers, translating the files of
+        # SHARD_INDEX, from 0 (see RepositoryTranslator.merge_shards).
+        self.SHARD_INDEX = 0
+        self.SHARD_COUNT = 1
+        # JSON report of repository updates written to this path, if set.
+        self.REPORT_PATH = ""
+        # Folder of cProfile and tracemalloc profiles of updates, if set.
+        self.PROFILE_PATH = ""
+        # Progress of repository updates (see adapters) : disabled, bar, log.
+        self.PROGRESS = "disabled"
+        # Prometheus metrics written to this path after updates, if set (see metrics.py).
+        self.METRICS_PATH = ""
+        # Bearer token required by the local translation service, if set (see server.py).
+        self.SERVER_TOKEN = ""
+
         self.VERBOSE = True
         self.CODE_TRANSLATED = False
+        # Translate modified paragraphs sentence by sentence (see Markdown.update),
+        # translations of sentences gone from the source being pruned by updates.
+        self.SPLIT_SENTENCES = False
         self.KEEP_CLEAN = False
 
         self.EDIT_LINKS = True
@@ -34,10 +71,70 @@ class Configuration:
         self.load_ini()
         self.load_environment()
 
+    def __getattr__(self, attribute):
+        # Only called for missing attributes, settings before their loading
+        if attribute.isupper() and '_loaded' not in self.__dict__:
+            self._load()
+            return getattr(self, attribute)
+        raise AttributeError(f"Unexisting configuration : {attribute}")
+
     @property
     def values(self):
         """ Retrieve all available configuration settings. """
-        return self.__dict__
+        if '_loaded' not in self.__dict__:
+            self._load()
+        return {key: value for key, value in self.__dict__.items() if key.isupper()}
+
+    @property
+    def revision(self):
+        """
+        Counter of settings modifications, to refresh data compiled from the
+        configuration. In-place changes of list settings are not counted.
+        """
+        if '_loaded' not in self.__dict__:
+            self._load()
+        return self.__dict__['_revision']
+
+    def __setattr__(self, attribute, value):
+        if attribute.isupper() and '_loaded' not in self.__dict__:
+            self._load()
+        super().__setattr__(attribute, value)
+        if attribute.isupper():
+            super().__setattr__('_revision', self.__dict__.get('_revision', 0) + 1)
+
+    @property
+    def hashes(self):
+        """ Adapters of the configuration, selected by their settings. """
+        from . import adapters
+        return adapters.hashes
+
+    @property
+    def translator(self):
+        from . import adapters
+        return adapters.translator
+
+    @property
+    def scheduler(self):
+        from . import adapters
+        return adapters.scheduler
+
+    @property
+    def progress(self):
+        from . import adapters
+        return adapters.progress
+
+    def snapshot(self, **settings):
+        """
+        Freeze current settings, with optional changes, for a run isolated
+        from later modifications of the configuration (see ConfigSnapshot).
+        """
+        values = self.values
+        for key, value in settings.items():
+            attribute = key.upper()
+            if attribute not in values:
+                raise MarkdownTranslatorError(f"Unexisting configuration : {attribute}")
+            values[attribute] = self._checked_value(attribute, value)
+        return ConfigSnapshot(values, self.revision)
 
     def __call__(self, **kwargs):
         """ Change any available setting of the configuration. """
@@ -45,14 +142,16 @@ class Configuration:
             self._setattr(key, value)
 
     def load_ini(self, ini_path='translations.ini'):
+        import configparser
         parser = configparser.ConfigParser()
         parser.read(ini_path)
         for key, value in parser.items('settings'):
             self._setattr(key, value)
 
     def load_environment(self):
+        settings = self.values
         for key, value in os.environ.items():
-            if hasattr(self, key.upper()):
+            if key.upper() in settings:
                 self._setattr(key, value)
 
     def _setattr(self, attribute, value):
@@ -61,10 +160,12 @@ class Configuration:
         if not hasattr(self, attribute):
             raise MarkdownTranslatorError(f"Unexisting configuration : {attribute}")
 
+        setattr(self, attribute, self._checked_value(attribute, value))
+
+    def _checked_value(self, attribute, value):
         try:
             attribute_type = type(getattr(self, attribute))
-            value = self._parse_value(value, attribute_type)
-            setattr(self, attribute, value)
+            return self._parse_value(value, attribute_type)
         except MarkdownTranslatorError:
             raise MarkdownTranslatorError(f"Invalid configuration for {attribute}: {value}")
 
@@ -79,6 +180,15 @@ class Configuration:
             return self._get_boolean(value)
         elif attribute_type == list:
             return [item.strip() for item in value.split(',')] if value else []
+        elif attribute_type == int:
+            return self._get_integer(value)
+
+    @staticmethod
+    def _get_integer(value):
+        try:
+            return int(value) if value else 0
+        except ValueError:
+            raise MarkdownTranslatorError
 
     @staticmethod
     def _get_boolean(value):
@@ -91,4 +201,55 @@ class Configuration:
             return False
         raise MarkdownTranslatorError
 
+class ConfigSnapshot:
+    """
+    Immutable settings of a run, created with config.snapshot(). Adapters are
+    bound once to the snapshot, apart from global ones, to run translations
+    with different settings concurrently in a process.
+
+    Usage example:
+    >>> settings = config.snapshot(dest_lang=["fr"], versioning="json")
+    >>> RepositoryTranslator("src_folder", "dest_folder", settings).update()
+    """
+    def __init__(self, values, revision, folder="."):
+        for key, value in values.items():
+            if isinstance(value, list):
+                value = tuple(value)
+            object.__setattr__(self, key, value)
+        object.__setattr__(self, "revision", revision)
+        # Folder of the hashes store
+        object.__setattr__(self, "folder", folder)
+
+    @property
+    def values(self):
+        return {key: value for key, value in self.__dict__.items() if key.isupper()}
+
+    def bind(self, folder):
+        """ Same settings with hashes stored in another folder. """
+        return ConfigSnapshot(self.values, self.revision, folder)
+
+    @functools.cached_property
+    def hashes(self):
+        from . import adapters
+        return adapters.hashes.adapter(self.VERSIONING)(self.folder)
+
+    @functools.cached_property
+    def translator(self):
+        from . import adapters
+        return functools.partial(
+                adapters.translator.adapter(self.TRANSLATION_ENGINE), settings=self)
+
+    @functools.cached_property
+    def scheduler(self):
+        from . import adapters
+        return adapters.scheduler.adapter(self.SCHEDULING)
+
+    @functools.cached_property
+    def progress(self):
+        from . import adapters
+        return adapters.progress.adapter(self.PROGRESS)
+
+    def __setattr__(self, attribute, value):
+        raise MarkdownTranslatorError(f"Configuration snapshots are immutable: {attribute}")
+
 config = Configuration()
@@ -0,0 +1,50 @@
+import atexit
+import json
+import os
+import threading
+from .exceptions import MarkdownTranslatorError
+from .instrumentation import stage
+
+class ConverterWorker:
+    """
+    Node process of html-converter.js converting HTML to markdown, kept alive
+    between conversions to avoid a Node startup for each of them.
+
+    Started on first conversion, and again if the process stopped.
+    """
+    def __init__(self):
+        module_dir = os.path.dirname(os.path.abspath(__file__))
+        self.js_file = os.path.join(module_dir, 'html-converter.js')
+        self.process = None
+        self.lock = threading.Lock()
+
+    def convert(self, html_text):
+        """ Convert HTML representation in pure markdown. """
+        with self.lock, stage("converter.convert"):
+            if self.process is None or self.process.poll() is not None:
+                self._start()
+            try:
+                self.process.stdin.write(json.dumps(html_text) + "\n")
+                self.process.stdin.flush()
+                answer = self.process.stdout.readline()
+            except BrokenPipeError:
+                answer = ""
+            if not answer:
+                self.close()
+                raise MarkdownTranslatorError("HTML converter stopped unexpectedly")
+            return json.loads(answer)
+
+    def close(self):
+        if self.process is not None:
+            self.process.stdin.close()
+            self.process.wait()
+            self.process = None
+
+    def _start(self):
+        import subprocess
+        self.process = subprocess.Popen(['node', self.js_file, '--serve'],
+                        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                        text=True, encoding="utf-8")
+
+converter = ConverterWorker()
+atexit.register(converter.close)
@@ -0,0 +1,159 @@
+import contextlib
+import json
+import os
+import pathlib
+import threading
+
+try:
+    import fcntl
+except ImportError: # Files are not locked on Windows
+    fcntl = None
+
+# Files written during bulk_writes by each thread, synchronized at its end,
+# and writes deferred to its end
+_bulk = threading.local()
+
+def write_text(path, pieces):
+    """
+    Write text into a file atomically, through a temporary file renamed once
+    written. Unchanged files are not written, keeping their modification time.
+
+    Text is given as a function producing pieces of the text, to compare and
+    write it without rendering the entire text. Return True if written.
+    Text is written in UTF-8 as is, without newlines translation.
+    """
+    path = pathlib.Path(path)
+    if _is_unchanged(path, pieces):
+        return False
+    bulk_files = getattr(_bulk, "files", None)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}")
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(temporary_path)
+    # New files get default permissions of open(), the umask being applied
+    fd = os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with open(fd, 'w', encoding="utf-8", newline="") as file:
+            for piece in pieces():
+                file.write(piece)
+            if bulk_files is None:
+                file.flush()
+                os.fsync(file.fileno())
+        with contextlib.suppress(FileNotFoundError):
+            os.chmod(temporary_path, path.stat().st_mode)
+        os.replace(temporary_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(temporary_path)
+        raise
+
+    if bulk_files is not None:
+        bulk_files.add(path)
+    return True
+
+@contextlib.contextmanager
+def bulk_writes():
+    """
+    Synchronize files written in the context to disk at once, at its end,
+    after writes deferred with defer_write.
+    """
+    if getattr(_bulk, "files", None) is not None:
+        yield
+        return
+
+    _bulk.files, _bulk.deferred = set(), {}
+    try:
+        yield
+    finally:
+        try:
+            while _bulk.deferred:
+                _bulk.deferred.popitem()[1]()
+        finally:
+            files, _bulk.files, _bulk.deferred = _bulk.files, None, None
+            for file in files | {file.parent for file in files}:
+                _fsync(file)
+
+def defer_write(key, write):
+    """
+    Defer a write to the end of the current bulk_writes, once per key.
+    Return False outside of bulk_writes, the write being up to the caller.
+    """
+    deferred = getattr(_bulk, "deferred", None)
+    if deferred is None:
+        return False
+    deferred.setdefault(key, write)
+    return True
+
+def _is_unchanged(path, pieces):
+    """ Compare bytes of a file, to rewrite files with other newlines. """
+    try:
+        with open(path, 'rb') as file:
+            for piece in pieces():
+                piece = piece.encode("utf-8")
+                if file.read(len(piece)) != piece:
+                    return False
+            return file.read(1) == b""
+    except FileNotFoundError:
+        return False
+
+def _fsync(path):
+    with contextlib.suppress(OSError):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def read_json(path, default=None):
+    """
+    Load a JSON file shared with other processes, or default if missing.
+    Writers replace the file at once, it is never read half written.
+    """
+    with contextlib.suppress(FileNotFoundError), open(path, encoding="utf-8") as file:
+        if content := file.read():
+            return json.loads(content)
+    return default
+
+def update_json(path, apply):
+    """
+    Read-modify-write of a JSON file shared with other processes: the file
+    is locked while apply modifies its current content, and replaced by a
+    new file written entirely, a failure never leaving it truncated.
+    Return the content.
+    """
+    with _locked(path) as file:
+        content = file.read()
+        data = json.loads(content) if content else {}
+        apply(data)
+        write_text(path, lambda: [json.dumps(data, indent=4)])
+    return data
+
+@contextlib.contextmanager
+def _locked(path):
+    """
+    Open a file locked against other processes, if supported. The lock is
+    attached to the file replaced by the lock owner: the file is opened
+    again until locked while still in place.
+    """
+    while True:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+        with open(fd, 'r', encoding="utf-8") as file:
+            if fcntl is None:
+                yield file
+                return
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                if not _is_replaced(path, fd):
+                    yield file
+                    return
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+def _is_replaced(path, fd):
+    """ Control if an opened file was replaced, or deleted, at its path. """
+    try:
+        return os.stat(path).st_ino != os.fstat(fd).st_ino
+    except FileNotFoundError:
+        return True
@@ -22,17 +22,28 @@ turndownService.addRule('keepDiv', {
   }
 });
 
-// Read HTML from stdin
-let html = "";
-process.stdin.on('readable', () => {
-  let chunk;
-  while ((chunk = process.stdin.read())) {
-    html += chunk;
-  }
-});
+// With --serve, convert HTML documents until stdin is closed: each input
+// line is a JSON string of HTML, answered by a JSON string of markdown.
+if (process.argv.includes('--serve')) {
+  const readline = require('readline');
+  const lines = readline.createInterface({input: process.stdin});
+  lines.on('line', (line) => {
+    const markdown = turndownService.turndown(JSON.parse(line));
+    process.stdout.write(JSON.stringify(markdown) + "\n");
+  });
+} else {
+  // Read HTML from stdin
+  let html = "";
+  process.stdin.on('readable', () => {
+    let chunk;
+    while ((chunk = process.stdin.read())) {
+      html += chunk;
+    }
+  });
 
-// Convert html to markdown, write output to stdout
-process.stdin.on('end', () => {
-  const markdown = turndownService.turndown(html);
-  process.stdout.write(markdown);
-});
+  // Convert html to markdown, write output to stdout
+  process.stdin.on('end', () => {
+    const markdown = turndownService.turndown(html);
+    process.stdout.write(markdown);
+  });
+}
@@ -0,0 +1,108 @@
+"""
+Timing of translation stages, reported to hooks for telemetry.
+
+Each stage run calls hooks with its name, duration in seconds and details,
+as characters or bytes processed, file and language, and the name of the
+exception of a failed stage as error. Details known once the stage ran are
+added to the stage returned by the context. Without hooks, stages are not
+measured.
+
+Usage example:
+>>> with collect() as timings:
+...     RepositoryTranslator("src_folder", "dest_folder").update()
+>>> timings.summary()["translate"]["total"]
+"""
+import contextlib
+import threading
+import time
+
+# Replaced on change, to call hooks without lock
+_hooks = ()
+_hooks_lock = threading.Lock()
+
+class DisabledStage:
+    """ Stage run without hooks, ignoring its details. """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        return None
+
+    def add(self, **details):
+        return None
+
+_disabled = DisabledStage()
+
+class Stage:
+    """ Measure of a stage run, reported to hooks on exit. """
+    __slots__ = ("name", "details", "start")
+
+    def __init__(self, name, details):
+        self.name = name
+        self.details = details
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exception_type, *exception):
+        duration = time.perf_counter() - self.start
+        if exception_type is not None:
+            self.details["error"] = exception_type.__name__
+        for hook in _hooks:
+            hook(self.name, duration, self.details)
+
+    def add(self, **details):
+        """ Add details known during the stage, as bytes written. """
+        self.details.update(details)
+
+def stage(name, **details):
+    """ Context of a stage, measured only when hooks are registered. """
+    if not _hooks:
+        return _disabled
+    return Stage(name, details)
+
+def add_hook(hook):
+    """ Register a callable called as hook(stage, duration, details). """
+    global _hooks
+    with _hooks_lock:
+        _hooks = _hooks + (hook,)
+
+def remove_hook(hook):
+    global _hooks
+    with _hooks_lock:
+        _hooks = tuple(registered for registered in _hooks if registered is not hook)
+
+class Timings:
+    """ Hook aggregating stages: count, cumulative and maximal durations, sizes. """
+    def __init__(self):
+        self.stages = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, name, duration, details):
+        with self.lock:
+            stats = self.stages.setdefault(name, {
+                "count": 0, "total": 0.0, "max": 0.0, "characters": 0, "bytes": 0})
+            stats["count"] += 1
+            stats["total"] += duration
+            stats["max"] = max(stats["max"], duration)
+            stats["characters"] += details.get("characters", 0)
+            stats["bytes"] += details.get("bytes", 0)
+
+    def summary(self):
+        """ Statistics per stage, with mean duration of calls. """
+        with self.lock:
+            return {name: {**stats, "mean": stats["total"] / stats["count"]}
+                        for name, stats in sorted(self.stages.items())}
+
+@contextlib.contextmanager
+def collect():
+    """ Aggregate timings of stages run in the context. """
+    timings = Timings()
+    add_hook(timings)
+    try:
+        yield timings
+    finally:
+        remove_hook(timings)
@@ -0,0 +1,39 @@
+import re
+import weakref
+from .configuration import config
+
+class LinkRules:
+    """
+    Rules to select links edited with translations folders, compiled once from
+    EDIT_LINKS, EXCLUDE_URLS, URLS_ROOT and DEST_LANG settings.
+
+    Edit only absolute path, outside translations folders and excluded urls.
+    """
+    def __init__(self, settings):
+        self.revision = settings.revision
+        self.enabled = settings.EDIT_LINKS
+
+        # README.md could be used as home to the source language
+        excluded_urls = [*settings.EXCLUDE_URLS, "/README.md"]
+        ## Avoid links to translations folders
+        if settings.URLS_ROOT != "/":
+            excluded_urls.append(settings.URLS_ROOT)
+        self.excluded = re.compile("|".join(map(re.escape, excluded_urls)))
+        self.languages = {lang.lower() for lang in settings.DEST_LANG}
+
+    def is_editable(self, target):
+        if not self.enabled or not target.startswith("/"): return False
+        if self.excluded.match(target): return False
+
+        base_folder = target[1:].partition("/")[0]
+        return base_folder.lower() not in self.languages
+
+# Rules compiled for the configuration and its snapshots
+_compiled_rules = weakref.WeakKeyDictionary()
+
+def link_rules(settings=config):
+    """ Get rules of the settings, compiled again after any change. """
+    rules = _compiled_rules.get(settings)
+    if rules is None or rules.revision != settings.revision:
+        rules = _compiled_rules[settings] = LinkRules(settings)
+    return rules
@@ -1,12 +1,23 @@
 import mistletoe
 from mistletoe.markdown_renderer import MarkdownRenderer
-import subprocess
 import pathlib
 import os
-from . import adapters
-from .renderers import CodeDisabledHTMLRenderer
+from .renderers import (CodeDisabledHTMLRenderer, mistletoe_lock, render_html_block,
+                        renderer_context)
 from .configuration import config
-from .markdown_blocks import MarkdownBlocks
+from .links import link_rules
+from .chunks import ChunksCache, split_chunks
+from .converter import converter
+from .files import write_text
+from .instrumentation import stage
+from .markdown_blocks import MarkdownBlocks, block_hash, split_sentences
+from .stream import read_blocks
+
+# Blocks of markdown chunks, parsed or standardized (see INCREMENTAL_PARSING)
+parsed_chunks = ChunksCache()
+standardized_chunks = ChunksCache()
+# Paragraph separating chunks converted at once by html_to_markdown
+CHUNK_SEPARATOR = "MDTRANSLATORCHUNKSEPARATOR"
 
 class Markdown:
     """
@@ -14,35 +25,60 @@ class Markdown:
     tree. Possibility to update translated files to use with versioning.
 
     Split content into blocks manipulable blocks, based on hashes.
+
+    Settings and adapters come from the global configuration, or from the
+    settings snapshot given (see ConfigSnapshot).
     """
-    def __init__(self, text="", filename="", directory=".", restore_hashes=False):
+    def __init__(self, text="", filename="", directory=".", restore_hashes=False,
+                    settings=None):
+        self.settings = config if settings is None else settings
         self.blocks = MarkdownBlocks()
         # Filename could be relative to directory, path ensure file access
         self.filename = self.path = pathlib.Path(filename)
         if directory != ".":
             self.path = directory / self.filename
 
-        if self.path.is_file():
-            text = self.path.read_text()
-
-        self._split_markdown(text.strip())
+        size = self.path.stat().st_size if self.path.is_file() else None
+        self.streamed = size is not None and 0 < self.settings.STREAM_SIZE < size
+        if self.streamed:
+            with stage("read", file=str(self.path), bytes=size):
+                self._read_stream()
+        else:
+            if size is not None:
+                with stage("read", file=str(self.path), bytes=size):
+                    text = self.path.read_text()
+            self._split_markdown(text.strip())
         if restore_hashes:
-            old_hashes = adapters.hashes.get(self.filename)
+            old_hashes = self.settings.hashes.get(self.filename)
             self.blocks.refresh_hashes(old_hashes)
 
     def save(self, filename=None, save_hashes=True):
-        """ Render markdown content into a file and store hashes. """
+        """
+        Render markdown content into a file and store hashes. The file is
+        written only if its content changed, return True if written.
+        """
         if filename is not None:
             self.filename = self.path = pathlib.Path(filename)
-        self.path.parent.mkdir(parents=True, exist_ok=True)
-        self.path.write_text(str(self) + "\n")
+        with stage("write", file=str(self.path)) as measured:
+            written = write_text(self.path, self._render_pieces)
+            measured.add(bytes=self.path.stat().st_size if written else 0)
 
         if save_hashes:
-            adapters.hashes.set(self.filename, self.blocks.hashes)
+            self.settings.hashes.set(self.filename, self.blocks.hashes)
+        return written
+
+    def _render_pieces(self):
+        """ Render markdown content block by block, ending with a new line. """
+        separator = ""
+        for hash in self.blocks:
+            yield separator
+            yield self.blocks[hash]
+            separator = "\n\n"
+        yield "\n"
 
     def delete(self):
         self.path.unlink(missing_ok=True)
-        adapters.hashes.delete(self.filename)
+        self.settings.hashes.delete(self.filename)
 
     def translate(self, lang_to, lang_from=None):
         """
@@ -53,13 +89,18 @@ class Markdown:
 
         See translators.py for available tools.
         """
-        html_translation = adapters.translator(self.html, lang_to, lang_from)
-        translated_md = Markdown(self.html_to_markdown(html_translation))
+        html = self.html
+        with stage("translate", characters=len(html), lang=lang_to):
+            html_translation = self.settings.translator(html, lang_to, lang_from)
+        # Links are edited while splitting, on the same parsing of the translation
+        translated_md = self._derived()
+        translated_md._split_markdown(
+                self.html_to_markdown(html_translation).strip(),
+                links_lang=lang_to,
+                )
 
         # Keep same hashes from the untranslated version
         translated_md.blocks.refresh_hashes(self.blocks.hashes)
-
-        translated_md._edit_links(lang_to)
         return translated_md
 
     def update(self, new_version, lang_to, lang_from=None):
@@ -67,7 +108,10 @@ class Markdown:
         # Retrieve modified content to translate only these blocks
         if (diff_blocks := new_version.blocks - self.blocks) is None:
             return
-        translations = __class__(str(diff_blocks)).translate(lang_to, lang_from)
+        if self.settings.SPLIT_SENTENCES:
+            translations = self._translate_sentences(diff_blocks, lang_to, lang_from)
+        else:
+            translations = self._derived(str(diff_blocks)).translate(lang_to, lang_from)
 
         # Start from a non-translated state of the new version,
         # then recover old unchanged translations and add new ones.
@@ -77,6 +121,60 @@ class Markdown:
 
         self.blocks = new_blocks
 
+    def _translate_sentences(self, diff_blocks, lang_to, lang_from=None):
+        """
+        Translate modified blocks, paragraphs sentence by sentence. Sentences
+        already translated are recovered from the hashes store, only new ones
+        are sent to the translator and spliced into their paragraph.
+        """
+        paragraphs = {}
+        other_blocks = MarkdownBlocks({}, [])
+        for hash in diff_blocks:
+            with mistletoe_lock:
+                block_ast = mistletoe.Document(diff_blocks[hash])
+            if len(block_ast.children) == 1 and \
+                    isinstance(block_ast.children[0], mistletoe.block_token.Paragraph):
+                paragraphs[hash] = split_sentences(diff_blocks[hash])
+            else:
+                other_blocks[hash] = diff_blocks[hash]
+
+        # Retrieve known sentences, collect the others to translate them at once
+        known, missing = {}, {}
+        for sentences, _ in paragraphs.values():
+            for sentence in sentences:
+                sentence_hash = block_hash(sentence)
+                if sentence_hash in known or sentence_hash in missing:
+                    continue
+                translation = self.settings.hashes.get_sentence(lang_to, sentence_hash)
+                if translation is None:
+                    missing[sentence_hash] = sentence
+                else:
+                    known[sentence_hash] = translation
+
+        if missing:
+            translated = self._derived("\n\n".join(missing.values()))
+            translated = translated.translate(lang_to, lang_from)
+            # Isolated sentences must stay a paragraph each to be spliced
+            if len(translated.blocks) == len(missing):
+                new_sentences = dict(zip(missing, (translated.blocks[hash] \
+                                                for hash in translated.blocks)))
+                self.settings.hashes.set_sentences(lang_to, new_sentences)
+                known.update(new_sentences)
+            else:
+                for hash in paragraphs:
+                    other_blocks[hash] = diff_blocks[hash]
+                paragraphs = {}
+
+        translations = self._derived()
+        if len(other_blocks):
+            translations = self._derived(str(other_blocks)).translate(lang_to, lang_from)
+        for hash, (sentences, separators) in paragraphs.items():
+            parts = [known[block_hash(sentences[0])]]
+            for separator, sentence in zip(separators, sentences[1:]):
+                parts += [separator, known[block_hash(sentence)]]
+            translations.blocks[hash] = "".join(parts)
+        return translations
+
     def standardize(self):
         """
         Uniform content of raw user markdown by using both converter tools, from
@@ -84,91 +182,147 @@ class Markdown:
 
         Standardize markdown list, titles, etc. for hash generation.
         """
-        standardized_markdown = self.html_to_markdown(self.html)
-        self._split_markdown(standardized_markdown)
+        with stage("standardize", file=str(self.filename)):
+            if self.streamed:
+                self._standardize_stream()
+            elif self.settings.INCREMENTAL_PARSING:
+                self._standardize_chunks()
+            else:
+                standardized_markdown = self.html_to_markdown(self.html)
+                self._split_markdown(standardized_markdown)
+
+    def _standardize_stream(self):
+        """
+        Standardize a streamed file by groups of blocks of STREAM_SIZE
+        characters, to convert and parse again only a group at once.
+        """
+        blocks, group, size = self.blocks, self._derived(), 0
+        self.blocks = MarkdownBlocks({}, [])
+        for hash in blocks:
+            group.blocks.add(blocks[hash])
+            size += len(blocks[hash])
+            if size >= self.settings.STREAM_SIZE:
+                self._add_standardized(group)
+                group, size = self._derived(), 0
+        if len(group.blocks):
+            self._add_standardized(group)
+
+    def _add_standardized(self, group):
+        group.standardize()
+        for hash in group.blocks:
+            self.blocks.add(group.blocks[hash])
+
+    def _standardize_chunks(self):
+        """
+        Standardize only chunks of the content missing from the cache, with a
+        single conversion to markdown for all of them.
+        """
+        mode = self.settings.CODE_TRANSLATED
+        chunks = split_chunks(str(self))
+        missing = [chunk for chunk in dict.fromkeys(chunks) \
+                                    if not standardized_chunks.has(chunk, mode)]
+        if missing:
+            separator = f"<p>{CHUNK_SEPARATOR}</p>\n"
+            html = separator.join(self._derived(chunk).html for chunk in missing)
+            converted = self.html_to_markdown(html).split(CHUNK_SEPARATOR)
+            if len(converted) == len(missing):
+                for chunk, markdown in zip(missing, converted):
+                    standardized_chunks.set(chunk, self._parse_blocks(markdown.strip()), mode)
+
+        self.blocks.clean()
+        for chunk in chunks:
+            chunk_blocks = standardized_chunks.get(chunk, self._standardize_chunk, mode)
+            for block_content in chunk_blocks:
+                self.blocks.add(block_content)
+
+    def _standardize_chunk(self, chunk):
+        markdown = self.html_to_markdown(self._derived(chunk).html)
+        return self._parse_blocks(markdown.strip())
 
     @staticmethod
     def html_to_markdown(html_text):
         """ Convert HTML representation in pure markdown. """
-        # Retrieve javscript file location inside python module
-        module_dir = os.path.dirname(os.path.abspath(__file__))
-        js_file = os.path.join(module_dir, 'html-converter.js')
-
-        # Call javascript library with node to convert html in markdown
-        converter = subprocess.Popen(['node', js_file], \
-                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
-        markdown, _ = converter.communicate(input=html_text)
-        return markdown
+        # Javascript library called with a node process kept alive
+        with stage("html_to_markdown", characters=len(html_text)):
+            return converter.convert(html_text)
 
     @property
     def html(self):
-        """ Get HTML representation of the markdown """
+        """ Get HTML representation of the markdown, joining HTML of blocks. """
         # Need of special attributes in HTML to avoid translations on some tags
-        if config.CODE_TRANSLATED:
+        if self.settings.CODE_TRANSLATED:
             renderer = mistletoe.HTMLRenderer
         else:
             renderer = CodeDisabledHTMLRenderer
-        return mistletoe.markdown(str(self), renderer)
+        with stage("render_html"):
+            return "".join(render_html_block(self.blocks[hash], renderer) \
+                                                        for hash in self.blocks)
+
+    def _split_markdown(self, markdown_text, links_lang=None):
+        """
+        Parse markdown content to divide into blocks, by title, paragraph...
 
-    def _split_markdown(self, markdown_text):
-        """ Parse markdown content to divide into blocks, by title, paragraph... """
+        With links_lang, links of the ast are edited before blocks rendering,
+        to point to translations of the language (see _edit_ast_links).
+        """
         self.blocks.clean()
 
-        ast = mistletoe.Document(markdown_text)
-        for block in ast.children:
-            block_content = self._ast_render(block)
+        if self.settings.INCREMENTAL_PARSING and links_lang is None:
+            blocks = []
+            for chunk in split_chunks(markdown_text):
+                blocks.extend(parsed_chunks.get(chunk, self._parse_blocks))
+        else:
+            blocks = self._parse_blocks(markdown_text, links_lang)
+
+        for block_content in blocks:
             self.blocks.add(block_content)
 
-    def _edit_links(self, extension):
+    def _parse_blocks(self, markdown_text, links_lang=None):
+        """ Render top-level blocks of a markdown text. """
+        blocks = []
+        with stage("parse", characters=len(markdown_text)), mistletoe_lock:
+            ast = mistletoe.Document(markdown_text)
+            with renderer_context(MarkdownRenderer) as renderer:
+                for block in ast.children:
+                    if links_lang is not None and self.settings.EDIT_LINKS:
+                        with stage("edit_links"):
+                            self._edit_ast_links(block, links_lang)
+                    blocks.append(renderer.render(block).strip())
+        return blocks
+
+    def _read_stream(self):
+        """ Split markdown content of the file incrementally, see stream.py """
+        self.blocks.clean()
+        with self.path.open() as file:
+            for block_content in read_blocks(file):
+                self.blocks.add(block_content)
+
+    def _edit_ast_links(self, ast, extension):
         """
-        Modify markdown links of an entire document to create subfolder with
-        translations. To configure with EDIT_LINKS and EXCLUDE_URLS settings.
+        Modify markdown links of an ast to create subfolder with translations.
+        To configure with EDIT_LINKS and EXCLUDE_URLS settings.
 
         Edit only absolute path, example : /abs/path -> /en/abs/path
         """
-        # Transform markdown blocks into ast to edit links inside it.
-        for hash in self.blocks:
-            block_ast = mistletoe.Document(self.blocks[hash])
-            self._edit_ast_links(block_ast, extension)
-            self.blocks[hash] = self._ast_render(block_ast)
-
-    def _edit_ast_links(self, ast, extension):
-        """ Explore and modify recursively all (nested) links of an entire ast. """
-        for token in ast.children:
-            if self._is_editable_link(token):
-                link_parts = (config.URLS_ROOT, extension, token.target[1:])
+        rules = link_rules(self.settings)
+        tokens = [ast]
+        while tokens:
+            token = tokens.pop()
+            if isinstance(token, mistletoe.span_token.Link) and \
+                    rules.is_editable(token.target):
+                link_parts = (self.settings.URLS_ROOT, extension, token.target[1:])
                 token.target = os.path.join(*link_parts)
 
-            if hasattr(token, 'children'):
-                self._edit_ast_links(token, extension)
-
-    @staticmethod
-    def _is_editable_link(ast_token):
-        if config.EDIT_LINKS == False: return False
-        if not isinstance(ast_token, mistletoe.span_token.Link): return False
-        if not ast_token.target.startswith("/"): return False
+            # Leaf tokens have no children, or set to None
+            if children := getattr(token, 'children', None):
+                tokens.extend(children)
 
-        for exclude_url in config.EXCLUDE_URLS:
-            if ast_token.target.startswith(exclude_url): return False
-
-        ## Avoid links to translations folders
-        if config.URLS_ROOT != "/":
-            if ast_token.target.startswith(config.URLS_ROOT): return False
-        # README.md could be used as home to the source language
-        if ast_token.target.startswith("/README.md"): return False
-
-        base_folder = ast_token.target.split("/")[1]
-        for lang in config.DEST_LANG:
-            if lang.lower() == base_folder.lower(): return False
-        return True
+    def _derived(self, text=""):
+        """ New markdown content sharing the settings of this one. """
+        return __class__(text, settings=self.settings)
 
     def is_updated(self):
-        return adapters.hashes.get(self.filename) != self.blocks.hashes
-
-    @staticmethod
-    def _ast_render(ast):
-        with MarkdownRenderer() as renderer:
-            return renderer.render(ast).strip()
+        return self.settings.hashes.get(self.filename) != self.blocks.hashes
 
     def __str__(self):
         return str(self.blocks)
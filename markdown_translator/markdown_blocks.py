@@ -1,5 +1,79 @@
 import copy
 import hashlib
+import re
+
+# End of a sentence: punctuation followed by spaces, before a new sentence.
+SENTENCE_END = re.compile(r'(?<=[.!?\u3002\uff01\uff1f])(\s+)(?=\S)')
+# Sentences which would be read as another block type once isolated.
+BLOCK_MARKER = re.compile(r'([#>*+-]|\d+[.)]|=+|-+)(\s|$)')
+# Numbers or initials ending with a dot (e.g. "1.", "J.") do not end a sentence.
+ABBREVIATION = re.compile(r'(^|[\s.(])(\d+|\w)\.$')
+# Escaped characters and code spans, ignored to find emphasis and HTML spans.
+LITERAL = re.compile(r'\\.|`[^`]*`')
+# Emphasis and strikethrough delimiter runs, and inline HTML tags.
+DELIMITER_RUN = re.compile(r'\*+|_+|~+')
+HTML_TAG = re.compile(r'<(/?)([A-Za-z][\w-]*)(?:\s[^<>]*)?(/?)>')
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link",
+             "meta", "source", "track", "wbr"}
+
+def block_hash(content):
+    return hashlib.md5(content.encode()).hexdigest()
+
+def split_sentences(text):
+    """
+    Segment a paragraph into sentences, keeping separators to rebuild the
+    paragraph. Never split inside inline code, links, images, emphasis or
+    inline HTML elements.
+
+    Return a tuple (sentences, separators), separators containing one item
+    less than sentences.
+    """
+    sentences, separators = [], []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        sentence = text[start:match.start()]
+        if sentence.count("`") % 2 or sentence.count("[") != sentence.count("]") \
+                or sentence.count("(") != sentence.count(")") \
+                or ABBREVIATION.search(sentence) or BLOCK_MARKER.match(text, match.end()) \
+                or _has_open_spans(sentence):
+            continue
+        sentences.append(sentence)
+        separators.append(match.group(1))
+        start = match.end()
+    sentences.append(text[start:])
+    return sentences, separators
+
+def _has_open_spans(sentence):
+    """
+    Control if emphasis or inline HTML elements opened in a sentence are
+    still open at its end. Delimiter runs open when followed by a non-space
+    and close a same run when preceded by one, as CommonMark flanking runs.
+    """
+    sentence = LITERAL.sub(" ", sentence)
+    runs = []
+    for match in DELIMITER_RUN.finditer(sentence):
+        run = match.group()
+        before = sentence[match.start() - 1] if match.start() else " "
+        after = sentence[match.end()] if match.end() < len(sentence) else " "
+        # Underscores inside words, as snake_case, are not emphasis
+        if run[0] == "_" and before.isalnum() and after.isalnum():
+            continue
+        if run in runs and not before.isspace():
+            del runs[len(runs) - 1 - runs[::-1].index(run)]
+        elif not after.isspace():
+            runs.append(run)
+
+    tags = []
+    for match in HTML_TAG.finditer(sentence):
+        closing, name, self_closing = match.groups()
+        name = name.lower()
+        if self_closing or name in VOID_TAGS:
+            continue
+        if not closing:
+            tags.append(name)
+        elif name in tags:
+            del tags[len(tags) - 1 - tags[::-1].index(name)]
+    return bool(runs or tags)
 
 class MarkdownBlocks:
     """
@@ -14,13 +88,18 @@ class MarkdownBlocks:
 
     def add(self, content):
         """ Add a new block of content with its associated hash. """
-        block_hash = hashlib.md5(content.encode()).hexdigest()
-        self.childrens[block_hash] = content
-        self.hashes.append(block_hash)
+        hash = block_hash(content)
+        self.childrens[hash] = content
+        self.hashes.append(hash)
 
     def copy(self):
         return copy.deepcopy(self)
 
+    def sentence_hashes(self):
+        """ Hashes of sentences of blocks, as split to be translated. """
+        return {block_hash(sentence) for content in self.childrens.values()
+                    for sentence in split_sentences(content)[0]}
+
     def pick_translations(self, translated_blocks):
         """ Select translation to insert into blocks. """
         for hash in self:
@@ -0,0 +1,180 @@
+"""
+Metrics of the process in the Prometheus text format, aggregated from stages
+of translators, hashes stores and the HTML converter (see instrumentation.py).
+
+Exposed on GET /metrics by the translation service (see server.py), or
+written after each repository update to METRICS_PATH, for the textfile
+collector of the node exporter.
+
+Usage example:
+>>> metrics.enable()
+>>> RepositoryTranslator("src_folder", "dest_folder").update()
+>>> metrics.write_textfile("/var/lib/node_exporter/markdown_translator.prom")
+"""
+import os
+import pathlib
+import threading
+import time
+from .instrumentation import add_hook, remove_hook
+
+PREFIX = "markdown_translator_"
+TRANSLATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+HASHES_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1)
+
+DESCRIPTIONS = {
+    "translation_seconds": ("histogram", "Duration of translations of markdown contents."),
+    "characters_translated_total": ("counter", "HTML characters sent to the translator."),
+    "translator_requests_total": ("counter", "Requests to the translator API by status code."),
+    "translator_errors_total": ("counter", "Failed requests to the translator API."),
+    "converter_busy_seconds_total": ("counter", "Time the HTML converter worker spent converting."),
+    "converter_conversions_total": ("counter", "Conversions of the HTML converter worker."),
+    "converter_utilization": ("gauge", "Busy ratio of the HTML converter worker since collection start."),
+    "hashes_operation_seconds": ("histogram", "Duration of hashes stores reads and writes."),
+    "cache_lookups_total": ("counter", "Lookups of parsing and rendering caches."),
+    "cache_hits_total": ("counter", "Hits of parsing and rendering caches."),
+}
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+class Histogram:
+    """ Cumulative counts of observations below each bucket bound. """
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        for bound, count in zip(self.buckets, self.counts):
+            yield f"{name}_bucket{_labels(labels + (('le', bound),))} {count}"
+        yield f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {self.count}"
+        yield f"{name}_sum{_labels(labels)} {self.sum}"
+        yield f"{name}_count{_labels(labels)} {self.count}"
+
+class Metrics:
+    """
+    Hook aggregating stages into counters and histograms, by metric name and
+    labels, rendered in the Prometheus text exposition format.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self._reset()
+
+    def _reset(self):
+        self.started = time.perf_counter()
+        self.counters = {}
+        self.histograms = {}
+
+    def enable(self):
+        """
+        Start collecting stages of the process, once, from empty metrics.
+        Return False if already enabled.
+        """
+        with self.lock:
+            if self.enabled:
+                return False
+            self._reset()
+            add_hook(self)
+            self.enabled = True
+            return True
+
+    def disable(self):
+        with self.lock:
+            if self.enabled:
+                remove_hook(self)
+                self.enabled = False
+
+    def __call__(self, stage, duration, details):
+        if stage == "translate":
+            labels = (("lang", details.get("lang", "")),)
+            self._observe("translation_seconds", labels, duration, TRANSLATION_BUCKETS)
+            self._increment("characters_translated_total", labels, details.get("characters", 0))
+        elif stage == "translator.request":
+            status = str(details.get("status") or details.get("error", "unknown"))
+            labels = (("engine", details.get("engine", "")), ("status", status))
+            self._increment("translator_requests_total", labels)
+            if status != "200":
+                self._increment("translator_errors_total", labels)
+        elif stage == "converter.convert":
+            self._increment("converter_busy_seconds_total", (), duration)
+            self._increment("converter_conversions_total", ())
+        elif stage.startswith("hashes."):
+            labels = (("operation", stage[len("hashes."):]), ("store", details.get("store", "")))
+            self._observe("hashes_operation_seconds", labels, duration, HASHES_BUCKETS)
+
+    def _increment(self, name, labels, value=1):
+        with self.lock:
+            key = (name, labels)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def _observe(self, name, labels, value, buckets):
+        with self.lock:
+            key = (name, labels)
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(buckets)
+            self.histograms[key].observe(value)
+
+    def samples(self):
+        """ Current values of counters and gauges, with caches counters. """
+        from .report import caches_counters
+        with self.lock:
+            samples = dict(self.counters)
+            elapsed = time.perf_counter() - self.started
+        busy = samples.get(("converter_busy_seconds_total", ()), 0)
+        samples[("converter_utilization", ())] = min(busy / elapsed, 1.0) if elapsed else 0.0
+        for cache, counters in caches_counters().items():
+            labels = (("cache", cache),)
+            samples[("cache_lookups_total", labels)] = counters["lookups"]
+            samples[("cache_hits_total", labels)] = counters["lookups"] - counters["misses"]
+        return samples
+
+    def render(self):
+        """ Metrics in the Prometheus text exposition format. """
+        samples = self.samples()
+        with self.lock:
+            histograms = {(name, labels): list(histogram.lines(PREFIX + name, labels))
+                            for (name, labels), histogram in self.histograms.items()}
+        lines = []
+        for name, (kind, description) in DESCRIPTIONS.items():
+            series = sorted(key for key in (histograms if kind == "histogram" else samples)
+                                if key[0] == name)
+            if not series:
+                continue
+            lines.append(f"# HELP {PREFIX}{name} {description}")
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+            for key in series:
+                if kind == "histogram":
+                    lines.extend(histograms[key])
+                else:
+                    lines.append(f"{PREFIX}{name}{_labels(key[1])} {samples[key]}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, filename):
+        """ Write metrics atomically, not to be scraped half written. """
+        path = pathlib.Path(filename)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_name(f".{path.name}.{os.getpid()}")
+        temporary.write_text(self.render())
+        os.replace(temporary, path)
+
+metrics = Metrics()
@@ -0,0 +1,57 @@
+import hashlib
+import os
+import pathlib
+
+class PathsMatcher:
+    """
+    Files and folders patterns of an include or exclude list, compiled into a
+    trie of reversed path parts. Patterns match indistinctly files or folders,
+    anywhere in a path.
+    """
+    def __init__(self, patterns):
+        self.trie = {}
+        for pattern in patterns:
+            node = self.trie
+            for part in reversed(pathlib.Path(pattern).parts):
+                node = node.setdefault(part, {})
+            node[None] = True
+
+    def match_end(self, parts):
+        """ Control if a pattern match the last parts of a path. """
+        node = self.trie
+        if None in node: return True
+        for part in reversed(parts):
+            if (node := node.get(part)) is None: return False
+            if None in node: return True
+        return False
+
+    def match(self, parts):
+        """ Control if a pattern match any parts of a path. """
+        return any(self.match_end(parts[:end]) for end in range(1, len(parts) + 1))
+
+def walk_files(folder, excluded, included, suffix=".md"):
+    """
+    Explore lazily files of a folder, with paths relative to the folder.
+
+    Excluded files and folders are pruned without being explored, files with
+    the suffix or included by patterns are yielded.
+    """
+    folders = [(folder, ())]
+    while folders:
+        directory, parts = folders.pop()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                entry_parts = parts + (entry.name,)
+                # Parents are already controlled, only the end could match
+                if excluded.match_end(entry_parts):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    folders.append((entry.path, entry_parts))
+                elif entry.is_file() and (entry.name.endswith(suffix) \
+                                            or included.match(entry_parts)):
+                    yield pathlib.Path(*entry_parts)
+
+def shard_index(path, count):
+    """ Stable shard of a relative path among count shards, on any machine. """
+    digest = hashlib.md5(pathlib.PurePath(path).as_posix().encode()).digest()
+    return int.from_bytes(digest[:8], "big") % count
@@ -0,0 +1,165 @@
+import json
+import pathlib
+import time
+from .configuration import config
+from .markdown import Markdown
+
+
+class TranslationUnit:
+    """
+    Translation of a source file in a single language, with the work it
+    requires: modified blocks, characters sent to the translator and
+    expected number of requests.
+    """
+    def __init__(self, file_plan, lang, translated_md):
+        self.file_plan = file_plan
+        self.lang = lang
+        self.translated_md = translated_md
+        # Partial units have hashes stored apart, see partial_key
+        self.done = False
+        self.partial = False
+
+        self.blocks = 0
+        self.characters = 0
+        self.requests = 0
+        if (diff_blocks := file_plan.source_md.blocks - translated_md.blocks):
+            diff_md = Markdown(settings=file_plan.source_md.settings)
+            diff_md.blocks = diff_blocks
+            self.blocks = len(diff_blocks)
+            self.characters = len(diff_md.html)
+            self.requests = 1
+
+    def to_dict(self):
+        return {
+            "file": str(self.file_plan.relative_source),
+            "lang": self.lang,
+            "blocks": self.blocks,
+            "characters": self.characters,
+            "requests": self.requests,
+        }
+
+
+class FilePlan:
+    """ Standardized source file with its translation units, one per language. """
+    def __init__(self, relative_source, source_md):
+        self.relative_source = relative_source
+        self.source_md = source_md
+        self.path = source_md.path
+        self.blocks = len(source_md.blocks)
+        # Sentences of the file, kept in the sentences store with SPLIT_SENTENCES
+        self.sentence_hashes = set()
+        self.units = []
+
+    @property
+    def completed(self):
+        return all(unit.done for unit in self.units)
+
+    def release(self):
+        """ Free markdown contents of a completed file, keeping its summary. """
+        self.source_md = None
+        for unit in self.units:
+            unit.translated_md = None
+
+
+class TranslationPlan:
+    """
+    Work plan of a repository update, prepared without any translation.
+
+    Report expected blocks, characters and requests per file and language.
+    The plan object can be executed by RepositoryTranslator.update to avoid
+    parsing and comparing files again, while the files are unchanged. With
+    SPLIT_SENTENCES, characters are an upper bound as sentences already
+    translated are not sent again.
+
+    Contents of all files are kept in memory until the plan is executed,
+    unlike updates without a plan, translating files as they are found.
+
+    Usage example:
+    >>> plan = RepositoryTranslator("src_folder", "dest_folder").plan()
+    >>> print(plan.characters, plan.requests)
+    >>> RepositoryTranslator("src_folder", "dest_folder").update(plan)
+    """
+    def __init__(self, files=None, settings=config):
+        self.files = files or []
+        self.settings = settings
+
+    @property
+    def units(self):
+        return [unit for file_plan in self.files for unit in file_plan.units]
+
+    @property
+    def pending(self):
+        return [unit for unit in self.units if not unit.done]
+
+    @property
+    def blocks(self):
+        return sum(unit.blocks for unit in self.units)
+
+    @property
+    def characters(self):
+        return sum(unit.characters for unit in self.units)
+
+    @property
+    def requests(self):
+        return sum(unit.requests for unit in self.units)
+
+    def to_dict(self):
+        """ Summary of the plan, only units with work to do are detailed. """
+        return {
+            "files": len(self.files),
+            "source_lang": self.settings.SOURCE_LANG,
+            "blocks": self.blocks,
+            "characters": self.characters,
+            "requests": self.requests,
+            "units": [unit.to_dict() for unit in self.units if unit.requests],
+        }
+
+    def save(self, filename):
+        """
+        Write the plan summary as a JSON file, to review the work before
+        executing the plan object. The summary cannot be executed.
+        """
+        with open(pathlib.Path(filename), "w") as plan_file:
+            json.dump(self.to_dict(), plan_file, indent=4)
+
+
+class Budget:
+    """
+    Limits of a repository update: characters sent to the translator and
+    seconds of execution, 0 for no limit. Units without anything to
+    translate are always allowed, units exceeding the characters left are
+    postponed while smaller ones may still fit.
+    """
+    def __init__(self, characters=0, seconds=0):
+        self.characters = characters
+        self.seconds = seconds
+        self.spent = 0
+        self.start = time.monotonic()
+
+    @property
+    def exhausted(self):
+        if self.characters and self.spent >= self.characters:
+            return True
+        return bool(self.seconds) and time.monotonic() - self.start >= self.seconds
+
+    def allows(self, unit):
+        if not unit.requests:
+            return True
+        return not self.characters or self.spent + unit.characters <= self.characters
+
+    def spend(self, unit):
+        self.spent += unit.characters
+
+
+def partial_key(lang, relative_source):
+    """
+    Hashes store key of a language translated when other languages of the
+    file were postponed, source hashes being stored once all are done.
+    """
+    return f"{lang}:{relative_source}"
+
+
+def source_key(key, langs):
+    """ Source file of a hashes store key, partial or not, for languages. """
+    lang, _, relative_source = key.partition(":")
+    return relative_source if relative_source and lang in langs else key
@@ -0,0 +1,58 @@
+import contextlib
+import json
+import pathlib
+
+class Profiler:
+    """
+    Profile of a repository update written into a folder, see PROFILE_PATH
+    setting: update.prof with cProfile statistics (for pstats, snakeviz...),
+    and tracemalloc snapshots of each stage of the update, with their peak
+    memory in memory.json.
+
+    cProfile only sees the thread running the update: work of other threads,
+    as the cleaning of languages folders by _clean, is missing from update.prof.
+    A memory trace already started is kept, and only stopped if started here.
+    Its peak is not reset either: peaks of stages are then the peak of the
+    trace since the caller started or reset it.
+
+    Usage example:
+    >>> pstats.Stats("profile/update.prof").sort_stats("cumulative").print_stats(20)
+    >>> tracemalloc.Snapshot.load("profile/translate.snapshot").statistics("lineno")
+    """
+    def __init__(self, folder):
+        self.folder = pathlib.Path(folder)
+        self.memory = {}
+        self.tracing = False
+
+    def __enter__(self):
+        import cProfile
+        import tracemalloc
+        self.folder.mkdir(parents=True, exist_ok=True)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.tracing = True
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exception):
+        import tracemalloc
+        self.profile.disable()
+        if self.tracing:
+            tracemalloc.stop()
+            self.tracing = False
+        self.profile.dump_stats(self.folder / "update.prof")
+        with open(self.folder / "memory.json", "w") as memory_file:
+            json.dump(self.memory, memory_file, indent=4)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """ Measure memory allocated by a stage, from its start. """
+        import tracemalloc
+        if self.tracing:
+            tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        yield
+        current, peak = tracemalloc.get_traced_memory()
+        self.memory[name] = {"start": start, "end": current, "peak": peak}
+        tracemalloc.take_snapshot().dump(str(self.folder / f"{name}.snapshot"))
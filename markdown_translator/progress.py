@@ -0,0 +1,141 @@
+import time
+
+class LanguageProgress:
+    """ Planned and completed work of an update in a language. """
+    def __init__(self, lang):
+        self.lang = lang
+        self.files = self.blocks = self.characters = 0
+        self.files_done = self.blocks_done = self.characters_done = 0
+        # Files compared with their translation, blocks and characters known
+        self.planned = 0
+        # Time spent on translations of the language
+        self.seconds = 0.0
+
+    @property
+    def throughput(self):
+        """ Characters translated per second, None before translations. """
+        if not self.characters_done or not self.seconds:
+            return None
+        return self.characters_done / self.seconds
+
+    @property
+    def eta(self):
+        """
+        Estimated seconds to complete the language, None if unknown: planned
+        characters at the current throughput, files not compared yet at the
+        pace of translated files.
+        """
+        if self.files_done == self.files:
+            return 0.0
+        if not self.files_done:
+            return None
+        file_seconds = self.seconds / self.files_done
+        remaining = self.characters - self.characters_done
+        if not remaining:
+            # Only unchanged files left, paced by files
+            planned_eta = file_seconds * (self.planned - self.files_done)
+        elif self.throughput:
+            planned_eta = remaining / self.throughput
+        else:
+            return None
+        return planned_eta + file_seconds * (self.files - self.planned)
+
+    def to_dict(self):
+        return {
+            "files": self.files, "files_done": self.files_done,
+            "blocks": self.blocks, "blocks_done": self.blocks_done,
+            "characters": self.characters, "characters_done": self.characters_done,
+            "throughput": self.throughput, "eta": self.eta,
+        }
+
+class Progress:
+    """
+    Progress of the translation units of an update, reported to a sink, see
+    PROGRESS setting: a callable called with the Progress when the update
+    starts, at most every interval seconds during translations, and once
+    finished.
+
+    Files to translate can be expected before being compared, their blocks
+    and characters being added once planned.
+
+    Usage example:
+    >>> def sink(progress):
+    ...     print(progress.languages["fr"].eta)
+    >>> RepositoryTranslator("src_folder", "dest_folder").update(progress=sink)
+    """
+    INTERVAL = 1.0
+
+    def __init__(self, sink, interval=INTERVAL):
+        self.sink = sink
+        self.interval = interval
+        self.languages = {}
+        self.finished = False
+        self.start = self.last = self.reported = time.perf_counter()
+
+    def expect(self, lang, files):
+        """ Count files to translate in a language, not compared yet. """
+        self._language(lang).files += files
+
+    def plan(self, units, expected=False):
+        """ Add work of planned units, with their files if not expected. """
+        for unit in units:
+            language = self._language(unit.lang)
+            language.files += not expected
+            language.planned += 1
+            language.blocks += unit.blocks
+            language.characters += unit.characters
+
+    def begin(self):
+        """ Report the planned work, translations starting. """
+        self.start = self.last = self.reported = time.perf_counter()
+        self.sink(self)
+
+    def advance(self, unit):
+        """
+        Count a translated unit, reporting if the interval elapsed. Units
+        not planned, as units already done, are ignored.
+        """
+        if (language := self.languages.get(unit.lang)) is None:
+            return
+        now = time.perf_counter()
+        language.seconds += now - self.last
+        language.files_done += 1
+        language.blocks_done += unit.blocks
+        language.characters_done += unit.characters
+        self.last = now
+        if now - self.reported >= self.interval:
+            self.reported = now
+            self.sink(self)
+
+    def _language(self, lang):
+        if lang not in self.languages:
+            self.languages[lang] = LanguageProgress(lang)
+        return self.languages[lang]
+
+    def finish(self):
+        self.finished = True
+        self.last = time.perf_counter()
+        self.sink(self)
+
+    @property
+    def elapsed(self):
+        return self.last - self.start
+
+    def total(self, name):
+        """ Sum of an attribute of languages, as files or characters_done. """
+        return sum(getattr(language, name) for language in self.languages.values())
+
+    @property
+    def eta(self):
+        """ Estimated seconds to complete the update, languages being sequential. """
+        etas = [language.eta for language in self.languages.values()]
+        return None if None in etas else sum(etas)
+
+    def to_dict(self):
+        return {
+            "elapsed": self.elapsed,
+            "finished": self.finished,
+            "eta": self.eta,
+            "languages": {lang: language.to_dict()
+                            for lang, language in self.languages.items()},
+        }
@@ -1,5 +1,23 @@
+import contextlib
 import html
+import threading
 import mistletoe
+from mistletoe import block_token, span_token
+from mistletoe.markdown_renderer import MarkdownRenderer
+from .markdown_blocks import block_hash
+
+# Renderers instances, reused per thread (see renderer_context)
+_renderers = threading.local()
+
+# Tokens and the document root of mistletoe are shared by the process:
+# parsing and rendering of documents are serialized between threads
+mistletoe_lock = threading.RLock()
+
+# HTML of blocks, by block hash and renderer
+_html_fragments = {}
+HTML_FRAGMENTS_LIMIT = 10000
+html_fragments_stats = {"lookups": 0, "misses": 0}
+html_fragments_lock = threading.Lock()
 
 class CodeDisabledHTMLRenderer(mistletoe.HTMLRenderer):
     """ Disabler of DeepL translation for Markdown code (inline and blocks). """
@@ -16,3 +34,48 @@ class CodeDisabledHTMLRenderer(mistletoe.HTMLRenderer):
         template = '<code translate="no">{}</code>'
         inner = self.escape_html_text(token.children[0].content)
         return template.format(inner)
+
+@contextlib.contextmanager
+def renderer_context(renderer_class):
+    """
+    Context of a renderer instance reused per thread, avoiding the renderer
+    creation for each rendering. As with a new mistletoe renderer, its extra
+    tokens are added to the parsing process for the duration of the context,
+    holding mistletoe_lock.
+    """
+    with mistletoe_lock:
+        pool = _renderers.__dict__.setdefault("pool", {})
+        if renderer_class not in pool:
+            pool[renderer_class] = renderer = renderer_class()
+        else:
+            renderer = pool[renderer_class]
+            if issubclass(renderer_class, MarkdownRenderer):
+                block_token.remove_token(block_token.Footnote)
+            for token in renderer._extras:
+                if issubclass(token, span_token.SpanToken):
+                    span_token.add_token(token)
+                else:
+                    block_token.add_token(token)
+        renderer.footnotes = {}
+        try:
+            yield renderer
+        finally:
+            renderer.__exit__(None, None, None)
+
+def render_html_block(block, renderer_class):
+    """
+    Get HTML of a markdown block, cached by block hash and renderer.
+    Content of a document is the concatenation of its blocks fragments.
+    """
+    key = (block_hash(block), renderer_class)
+    fragment = _html_fragments.get(key)
+    with html_fragments_lock:
+        html_fragments_stats["lookups"] += 1
+        html_fragments_stats["misses"] += fragment is None
+    if fragment is None:
+        with renderer_context(renderer_class) as renderer:
+            fragment = renderer.render(mistletoe.Document(block))
+        if len(_html_fragments) >= HTML_FRAGMENTS_LIMIT:
+            _html_fragments.clear()
+        _html_fragments[key] = fragment
+    return fragment
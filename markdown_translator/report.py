@@ -0,0 +1,102 @@
+import collections
+import datetime
+import json
+import threading
+import time
+from . import markdown, renderers
+from .files import write_text
+from .instrumentation import Timings, add_hook, remove_hook
+
+def caches_counters():
+    """ Lookups and misses of caches since the module import, by all threads. """
+    with renderers.html_fragments_lock:
+        html_fragments = dict(renderers.html_fragments_stats)
+    return {
+        "parsed_chunks": markdown.parsed_chunks.counters(),
+        "standardized_chunks": markdown.standardized_chunks.counters(),
+        "html_fragments": html_fragments,
+    }
+
+class RunReport:
+    """
+    Report of a repository update written as JSON, see REPORT_PATH setting:
+    work done per language, caches efficiency, slowest files and durations
+    of stages (see instrumentation.py).
+
+    Only stages of the thread running the update are reported, caches being
+    shared by the threads of the process during the update.
+    """
+    SLOWEST_FILES = 10
+
+    def __init__(self):
+        self.thread = threading.get_ident()
+        self.timings = Timings()
+        self.files_durations = collections.Counter()
+        self.started = datetime.datetime.now(datetime.timezone.utc)
+        self.start = time.perf_counter()
+        self.duration = None
+        self.caches = caches_counters()
+
+    def __call__(self, stage, duration, details):
+        if threading.get_ident() != self.thread:
+            return
+        self.timings(stage, duration, details)
+        if stage in ("plan_file", "translate_unit"):
+            self.files_durations[details["file"]] += duration
+
+    def __enter__(self):
+        add_hook(self)
+        return self
+
+    def __exit__(self, *exception):
+        remove_hook(self)
+        self.duration = time.perf_counter() - self.start
+
+    def to_dict(self, plan):
+        """ Summary of the update of a plan, once executed. """
+        languages = {}
+        for unit in plan.units:
+            stats = languages.setdefault(unit.lang, dict.fromkeys([
+                "files_updated", "files_skipped", "files_postponed",
+                "blocks_translated", "blocks_reused", "characters", "requests"], 0))
+            if not unit.done:
+                stats["files_postponed"] += 1
+                continue
+            stats["files_updated" if unit.requests else "files_skipped"] += 1
+            stats["blocks_translated"] += unit.blocks
+            stats["blocks_reused"] += unit.file_plan.blocks - unit.blocks
+            stats["characters"] += unit.characters
+            stats["requests"] += unit.requests
+
+        totals = collections.Counter()
+        for stats in languages.values():
+            totals.update(stats)
+
+        caches = {}
+        for name, counters in caches_counters().items():
+            lookups = counters["lookups"] - self.caches[name]["lookups"]
+            hits = lookups - (counters["misses"] - self.caches[name]["misses"])
+            caches[name] = {
+                "lookups": lookups,
+                "hits": hits,
+                "ratio": hits / lookups if lookups else None,
+            }
+
+        return {
+            "started": self.started.isoformat(),
+            "duration": self.duration,
+            "files_scanned": len(plan.files),
+            "languages": languages,
+            "totals": dict(totals),
+            "caches": caches,
+            "slowest_files": [
+                {"file": file, "duration": duration} for file, duration
+                    in self.files_durations.most_common(self.SLOWEST_FILES)
+            ],
+            "stages": self.timings.summary(),
+        }
+
+    def save(self, filename, plan):
+        """ Write the report atomically, not to be read half written. """
+        report = json.dumps(self.to_dict(plan), indent=4)
+        write_text(filename, lambda: [report])
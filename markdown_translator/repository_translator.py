@@ -1,6 +1,22 @@
+import contextlib
+import logging
+import os
 import pathlib
 from . import adapters, Markdown
 from .configuration import config
+from .exceptions import MarkdownTranslatorError
+from .files import bulk_writes, write_text
+from .instrumentation import stage
+from .metrics import metrics
+from .paths import PathsMatcher, shard_index, walk_files
+from .profiling import Profiler
+from .progress import Progress
+from .plan import (Budget, FilePlan, TranslationPlan, TranslationUnit,
+                   partial_key, source_key)
+from .report import RunReport
+from .watcher import create_watcher
+
+logger = logging.getLogger(__name__)
 
 class RepositoryTranslator:
     """
@@ -14,88 +30,487 @@ class RepositoryTranslator:
     >>> # Selected languages are defined in settings
     >>> RepositoryTranslator("src_folder", "dest_folder").update()
     """
-    def __init__(self, source, destination):
+    def __init__(self, source, destination, settings=None):
         self.source = pathlib.Path(source)
         self.destination = pathlib.Path(destination)
 
         self.destination.mkdir(parents=True, exist_ok=True)
-        adapters.hashes.select(config.VERSIONING, self.destination)
+        # A settings snapshot has its own hashes store, not the global one
+        if settings is None:
+            self.settings = config
+            adapters.hashes.select(config.VERSIONING, self.destination)
+        else:
+            self.settings = settings.bind(self.destination)
+
+    def update(self, plan=None, progress=None):
+        """
+        Generates versioned translations from the source folder, each file
+        being translated once found and compared, its contents then released.
+        A plan previously prepared with plan() is executed as is, without
+        exploring and comparing files again.
+
+        Files and languages are translated in SCHEDULING order, until
+        CHARACTERS_BUDGET or TIME_BUDGET would be exceeded: postponed
+        translations are resumed by the next update. Orders other than files,
+        or priorities, require to plan all files first. Return the executed
+        plan, with its pending units.
+
+        A JSON report of the update is written to REPORT_PATH, and profiles
+        to the PROFILE_PATH folder, if set. Progress of translations is
+        reported to the PROGRESS sink, or to a progress callable taking a
+        Progress (see progress.py). Metrics of the process are written to
+        METRICS_PATH once the update ends, failed or not.
+        """
+        report = profiler = None
+        with contextlib.ExitStack() as context:
+            if self.settings.METRICS_PATH:
+                metrics.enable()
+                context.callback(metrics.write_textfile, self.settings.METRICS_PATH)
+            if self.settings.PROFILE_PATH:
+                profiler = context.enter_context(Profiler(self.settings.PROFILE_PATH))
+            if self.settings.REPORT_PATH:
+                report = context.enter_context(RunReport())
+            plan = self._update(plan, profiler, progress)
+
+        if report is not None:
+            report.save(self.settings.REPORT_PATH, plan)
+        return plan
+
+    def _update(self, plan, profiler=None, progress=None):
+        def profiled(name):
+            return contextlib.nullcontext() if profiler is None else profiler.stage(name)
+
+        budget = Budget(self.settings.CHARACTERS_BUDGET, self.settings.TIME_BUDGET)
+        if self.settings.KEEP_CLEAN:
+            with stage("clean"), profiled("clean"):
+                self._clean()
+        if progress is None and self.settings.PROGRESS.lower() != "disabled":
+            progress = self.settings.progress
+        tracker = Progress(progress) if progress is not None else None
+
+        streamed = plan is None and self._streamed()
+        if streamed:
+            plan = TranslationPlan(settings=self.settings)
+            source_files = self._source_files()
+            if tracker is not None:
+                # Files are only listed to count them, parsed once translated
+                source_files = list(source_files)
+                for lang in self.settings.DEST_LANG:
+                    tracker.expect(lang, len(source_files))
+        else:
+            if plan is None:
+                with profiled("plan"):
+                    plan = self.plan()
+            plan.files = [self._reload(file_plan) if file_plan.source_md is None
+                            and not file_plan.completed else file_plan
+                                for file_plan in plan.files]
+            if tracker is not None:
+                tracker.plan(plan.pending)
+        if tracker is not None:
+            tracker.begin()
+
+        explored, not_reached = True, 0
+        with bulk_writes(), profiled("translate"):
+            if streamed:
+                source_files = iter(source_files)
+                for relative_source in source_files:
+                    file_plan = self._plan_file(relative_source)
+                    plan.files.append(file_plan)
+                    if tracker is not None:
+                        tracker.plan(file_plan.units, expected=True)
+                    translating = self._translate_units(file_plan.units, budget, tracker)
+                    if not file_plan.completed:
+                        self._postpone(file_plan)
+                    file_plan.release()
+                    if not translating:
+                        explored = False
+                        # Files after the stop point are only counted
+                        if self.settings.VERBOSE:
+                            not_reached = sum(1 for _ in source_files)
+                        break
+            else:
+                units = self.settings.scheduler(plan.pending)
+                self._translate_units(
+                        adapters.prioritize(units, self.settings), budget, tracker)
+                for file_plan in plan.files:
+                    if not file_plan.completed:
+                        self._postpone(file_plan)
+            # Translations of sentences gone from all files are forgotten
+            if self.settings.SPLIT_SENTENCES and explored:
+                self.settings.hashes.prune_sentences(set().union(
+                        *(file_plan.sentence_hashes for file_plan in plan.files)))
+        if (plan.pending or not_reached) and self.settings.VERBOSE:
+            message = f"Budget exhausted: {len(plan.pending)} translations postponed"
+            if not_reached:
+                message += f", {not_reached} files not reached"
+            print(message)
+        if tracker is not None:
+            tracker.finish()
+        return plan
+
+    def _translate_units(self, units, budget, tracker=None):
+        """
+        Translate units in order, postponing those exceeding the characters
+        left. Return False once the budget is exhausted.
+        """
+        for unit in units:
+            if unit.done:
+                continue
+            if budget.exhausted:
+                return False
+            if not budget.allows(unit):
+                continue
+            self._translate_unit(unit)
+            budget.spend(unit)
+            if tracker is not None:
+                tracker.advance(unit)
+        return not budget.exhausted
+
+    def _streamed(self):
+        """ Control if files can be translated as found, in discovery order. """
+        return self.settings.SCHEDULING.lower() == "files" and \
+                not self.settings.PRIORITY_FILES and not self.settings.PRIORITY_LANGS
+
+    def plan(self):
+        """
+        Prepare the translation work of the source folder without calling the
+        translator: files are parsed, standardized and compared with their
+        translations, to report blocks, characters and requests to process.
+        """
+        with stage("plan"):
+            return TranslationPlan(
+                    [self._plan_file(relative_source)
+                        for relative_source in self._source_files()],
+                    self.settings)
+
+    def merge_shards(self, shard_folders):
+        """
+        Combine destination folders of workers of a sharded update, listed in
+        order of their SHARD_INDEX, into the destination. Translations and
+        hashes of the files of each shard replace those of the destination,
+        translations of sentences of all shards are added.
+        """
+        with bulk_writes():
+            self._merge_shards(shard_folders)
+
+    def _merge_shards(self, shard_folders):
+        count = len(shard_folders)
+        langs = self.settings.DEST_LANG
+        for index, folder in enumerate(map(pathlib.Path, shard_folders)):
+            def in_shard(keys):
+                return {str(key) for key in keys
+                            if shard_index(source_key(str(key), langs), count) == index}
+
+            for lang in self.settings.DEST_LANG:
+                shard_files = in_shard(self._discover(folder / lang, is_traduction=True))
+                destination_files = in_shard(
+                        self._discover(self.destination / lang, is_traduction=True))
+                for file in destination_files - shard_files:
+                    os.unlink(self.destination / lang / file)
+                for file in shard_files:
+                    with open(folder / lang / file, encoding="utf-8", newline="") as shard_file:
+                        text = shard_file.read()
+                    write_text(self.destination / lang / file, lambda: [text])
+
+            shard_store = adapters.hashes.adapter(self.settings.VERSIONING)(folder)
+            shard_hashes = dict(shard_store.items())
+            shard_hashes = {key: shard_hashes[key] for key in in_shard(shard_hashes)}
+            outdated_keys = in_shard(key for key, _ in self.settings.hashes.items())
+            self.settings.hashes.delete_many(outdated_keys - shard_hashes.keys())
+            self.settings.hashes.set_many(shard_hashes)
+            for lang, translations in shard_store.sentences_items():
+                self.settings.hashes.set_sentences(lang, translations)
 
-    def update(self):
-        """ Generates versioned translations from the source folder. """
-        if config.KEEP_CLEAN:
-            self._clean()
+    def update_changes(self, from_revision, to_revision="HEAD"):
+        """
+        Generates versioned translations only for files changed between two
+        revisions of the git repository containing the source folder, expected
+        to be checked out at to_revision.
+
+        Translations of renamed files are moved with their hashes, to only
+        translate their modifications.
+        """
+        deleted_files = []
+        matchers = self._matchers()
+        changes = self._git_changes(from_revision, to_revision)
+        with bulk_writes():
+            for status, old_file, new_file in changes:
+                moved = False
+                if status in ("R", "=", "D") and self._is_managed(old_file, *matchers):
+                    if status != "D" and self._is_managed(new_file, *matchers):
+                        self._move_translations(old_file, new_file)
+                        moved = True
+                    else:
+                        self._delete_translations(old_file)
+                        deleted_files.append(old_file)
+
+                if status == "D" or (status == "=" and moved): continue
+                if self._is_managed(new_file, *matchers) and \
+                        self._in_shard(new_file) and (self.source / new_file).is_file():
+                    self._translate_file(new_file)
+        self._delete_hashes(deleted_files)
+
+    def watch(self, debounce=0.5, interval=1.0, polling=False, stop=None):
+        """
+        Monitor the source folder to translate modified files, until
+        interrupted or until the stop event is set. Bursts of modifications
+        are grouped until the folder stays quiet during the debounce delay.
+
+        Watch with inotify where available, else by polling every interval.
+        The HTML converter, the hashes store and caches are kept in memory.
+        Errors of a file are logged, the file being translated again on its
+        next modification.
+        """
+        matchers = self._matchers()
+        watcher = create_watcher(self.source, *matchers, polling=polling)
+        try:
+            while stop is None or not stop.is_set():
+                if not (changed := watcher.changes(interval)):
+                    continue
+                while more_changes := watcher.changes(debounce):
+                    changed |= more_changes
 
-        # Explore all mardown files from the source repository
-        for source_path in self._discover(self.source, absolute=True):
-            source_md = Markdown(filename=source_path)
+                for relative_source in sorted(changed):
+                    if not self._is_managed(relative_source, *matchers):
+                        continue
+                    try:
+                        if (self.source / relative_source).is_file():
+                            self._translate_file(relative_source)
+                        else:
+                            self._delete_translations(relative_source)
+                            self._delete_hashes([relative_source])
+                    except Exception:
+                        logger.exception("Translation of %s failed", relative_source)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
+
+    def _translate_file(self, relative_source):
+        """ Retrieve and update translations of a source file in each language. """
+        for unit in self._plan_file(relative_source).units:
+            self._translate_unit(unit)
+
+    def _plan_file(self, relative_source):
+        """ Compare a standardized source file with its translations. """
+        with stage("plan_file", file=str(relative_source)):
+            source_md = Markdown(
+                    filename=self.source / relative_source, settings=self.settings)
             source_md.standardize()
-            relative_source = source_path.relative_to(self.source)
 
-            # Retrieve and update translations of the file in each language
-            for lang in config.DEST_LANG:
+            file_plan = FilePlan(relative_source, source_md)
+            if self.settings.SPLIT_SENTENCES:
+                file_plan.sentence_hashes = source_md.blocks.sentence_hashes()
+            for lang in self.settings.DEST_LANG:
                 translated_md = Markdown(
                     filename=relative_source,
                     directory=self.destination / lang,
-                    restore_hashes=True,
+                    settings=self.settings,
                         )
-                translated_md.update(
-                                source_md,
-                                lang_to=lang,
-                                lang_from=config.SOURCE_LANG
-                                )
-                if config.VERBOSE and translated_md.is_updated():
-                    print(f"{lang} translated: {relative_source}")
+                # Languages translated by a run stopped early have their own hashes
+                hashes = self.settings.hashes
+                partial_hashes = hashes.get(partial_key(lang, relative_source))
+                translated_md.blocks.refresh_hashes(
+                        partial_hashes or hashes.get(relative_source))
+
+                unit = TranslationUnit(file_plan, lang, translated_md)
+                unit.partial = partial_hashes is not None
+                file_plan.units.append(unit)
+            return file_plan
+
+    def _reload(self, file_plan):
+        """ Compare again a postponed file released by an update, keeping done units. """
+        done_langs = {unit.lang for unit in file_plan.units if unit.done}
+        reloaded = self._plan_file(file_plan.relative_source)
+        for unit in reloaded.units:
+            unit.done = unit.lang in done_langs
+        return reloaded
+
+    def _translate_unit(self, unit):
+        """
+        Translate and save a file in a language, source hashes are stored
+        once all languages of the file are translated.
+        """
+        file_plan = unit.file_plan
+        with stage("translate_unit", file=str(file_plan.relative_source),
+                        lang=unit.lang, characters=unit.characters):
+            unit.translated_md.update(
+                            file_plan.source_md,
+                            lang_to=unit.lang,
+                            lang_from=self.settings.SOURCE_LANG
+                            )
+            if self.settings.VERBOSE and unit.translated_md.is_updated():
+                print(f"{unit.lang} translated: {file_plan.relative_source}")
+
+            unit.translated_md.save(save_hashes=False)
+        unit.done = True
+
+        if file_plan.completed:
+            self.settings.hashes.set(
+                    file_plan.relative_source, file_plan.source_md.blocks.hashes)
+            partial_keys = [partial_key(unit.lang, file_plan.relative_source)
+                                for unit in file_plan.units if unit.partial]
+            if partial_keys:
+                self.settings.hashes.delete_many(partial_keys)
+
+    def _postpone(self, file_plan):
+        """
+        Keep hashes of languages translated for a file still pending in
+        other languages, on a budget exceeded.
+        """
+        for unit in filter(lambda unit: unit.done, file_plan.units):
+            self.settings.hashes.set(
+                partial_key(unit.lang, file_plan.relative_source),
+                file_plan.source_md.blocks.hashes,
+                )
+            unit.partial = True
+
+    def _git_changes(self, from_revision, to_revision):
+        """
+        List files modified between two git revisions, relative to the source
+        folder, as (status, old_file, new_file) with status in A, C, D, M, R, T.
+        Unchanged renamed files are listed with status "=".
+        """
+        import subprocess
+        # Revisions starting with "-" must not be read as options
+        command = ["git", "-C", str(self.source), "diff", "--name-status", "-z",
+                   "--find-renames", "--relative", "--end-of-options",
+                   from_revision, to_revision]
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise MarkdownTranslatorError(f"Git error: {result.stderr.strip()}")
+
+        changes = []
+        fields = iter(result.stdout.split("\0")[:-1])
+        for status in fields:
+            old_file = new_file = pathlib.Path(next(fields))
+            if status[0] in "RC":
+                new_file = pathlib.Path(next(fields))
+            changes.append((status[0], old_file, new_file))
+            # A renamed file without modifications requires no translation
+            if status == "R100":
+                changes[-1] = ("=", old_file, new_file)
+        return changes
 
-                translated_md.save(save_hashes=False)
-            adapters.hashes.set(relative_source, source_md.blocks.hashes)
+    def _move_translations(self, old_file, new_file):
+        """ Move translations of a renamed file, with its hashes. """
+        for lang in self.settings.DEST_LANG:
+            old_path = self.destination / lang / old_file
+            if old_path.is_file():
+                new_path = self.destination / lang / new_file
+                new_path.parent.mkdir(parents=True, exist_ok=True)
+                old_path.replace(new_path)
+                self._remove_empty_parents(old_path, self.destination / lang)
+        if (hashes := self.settings.hashes.get(old_file)) is not None:
+            self.settings.hashes.set(new_file, hashes)
+        self._delete_hashes([old_file])
+
+    def _delete_translations(self, file):
+        """ Remove translations of a deleted source file, and empty directories. """
+        for lang in self.settings.DEST_LANG:
+            path = self.destination / lang / file
+            path.unlink(missing_ok=True)
+            self._remove_empty_parents(path, self.destination / lang)
+
+    @staticmethod
+    def _remove_empty_parents(path, folder):
+        """ Remove directories of a path left empty, up to the folder excluded. """
+        for directory in path.parents:
+            if directory == folder or folder not in directory.parents:
+                break
+            try:
+                directory.rmdir()
+            except OSError:
+                break
+
+    def _delete_hashes(self, files):
+        """ Delete hashes of removed files, with partial hashes of their translations. """
+        files = {str(file) for file in files}
+        langs = self.settings.DEST_LANG
+        self.settings.hashes.delete_many(files | {
+            partial_key(lang, file) for lang in langs for file in files
+            })
 
     def _discover(self, folder, absolute=False, is_traduction=False):
         """
         List all filenames from a folders (source folder, backup, translations...)
         on which the RepositoryTranslator will perform manipulations.
         """
-        required_files = []
-        for file in folder.rglob("*"):
-            if self._valid_file(file, is_traduction):
-                required_files.append(file)
+        return set(self._walk(folder, absolute, is_traduction))
 
-        if not absolute:
-            required_files = [file.relative_to(folder) for file in required_files]
-        return set(required_files)
+    def _walk(self, folder, absolute=False, is_traduction=False):
+        """
+        Explore lazily files of a folder to manipulate, excluded folders and
+        translations folders are not explored.
+        """
+        excluded, included = self._matchers(is_traduction)
+        for file in walk_files(folder, excluded, included):
+            yield folder / file if absolute else file
 
-    def _valid_file(self, file, is_traduction):
-        if not is_traduction and self._contained(file, config.DEST_LANG): return False
-        if self._contained(file, config.EXCLUDE_FILES): return False
-        if not file.is_file(): return False
+    def _source_files(self):
+        """ Explore lazily mardown files of the source folder, in the shard. """
+        return filter(self._in_shard, self._walk(self.source))
 
-        return file.suffix == ".md" or self._contained(file, config.INCLUDE_FILES)
+    def _in_shard(self, relative_source):
+        """ Control if a source file is translated by the configured shard. """
+        index, count = self.settings.SHARD_INDEX, self.settings.SHARD_COUNT
+        if count <= 1:
+            return True
+        if not 0 <= index < count:
+            raise MarkdownTranslatorError(f"Shard index {index} out of {count} shards")
+        return shard_index(relative_source, count) == index
 
     @staticmethod
-    def _contained(filename, controlled_paths):
+    def _is_managed(file, excluded, included):
+        """ Control if a source file, relative to its folder, is translated. """
+        parts = pathlib.Path(file).parts
+        if excluded.match(parts): return False
+        return parts[-1].endswith(".md") or included.match(parts)
+
+    def _matchers(self, is_traduction=False):
+        """ Get matchers of excluded and included files. """
+        excluded_paths = list(self.settings.EXCLUDE_FILES)
+        if not is_traduction:
+            excluded_paths += self.settings.DEST_LANG
+        return PathsMatcher(excluded_paths), PathsMatcher(self.settings.INCLUDE_FILES)
+
+    def _clean(self):
         """
-        Verify if a filename match a file pattern of an include or exclude list,
-        controlling indistinctly files or folders.
+        Delete untracked files and folders from a previous version, in each
+        language concurrently, and their hashes.
         """
-        filename_parts = filename.parts
-        for path in controlled_paths:
-            pattern = pathlib.Path(path).parts
-            for index in range(len(filename_parts)):
-                if pattern == filename_parts[index:index + len(pattern)]:
-                    return True
-        return False
+        from concurrent.futures import ThreadPoolExecutor
+        source_files = {str(file) for file in self._discover(self.source)}
+        managed_folders = [self.destination / lang for lang in self.settings.DEST_LANG]
 
-    def _clean(self):
-        """ Delete untracked files and folders from a previous version. """
-        managed_folders = [self.destination / lang for lang in config.DEST_LANG]
-        for folder in managed_folders:
-            # Remove files available only in a previous version
-            delete_list = self._discover(folder, is_traduction=True) - \
-                                                    self._discover(self.source)
-            for unwanted_file in delete_list:
-                pathlib.Path(folder / unwanted_file).unlink()
-
-            # Remove empty directories
-            for sub_folder in folder.rglob('*'):
-                if sub_folder.is_dir() and not any(sub_folder.iterdir()):
-                    sub_folder.rmdir()
+        with ThreadPoolExecutor() as executor:
+            deleted_files = set().union(*executor.map(
+                lambda folder: self._clean_folder(folder, source_files),
+                managed_folders))
+        self._delete_hashes(deleted_files)
+
+    def _clean_folder(self, folder, source_files):
+        """
+        Remove files of a translation folder missing from the source, and
+        empty directories, with a single bottom-up exploration.
+        """
+        excluded = PathsMatcher(self.settings.EXCLUDE_FILES)
+        included = PathsMatcher(self.settings.INCLUDE_FILES)
+
+        deleted_files = set()
+        for directory, _, files in os.walk(folder, topdown=False):
+            directory_parts = pathlib.Path(directory).relative_to(folder).parts
+            for file in files:
+                parts = directory_parts + (file,)
+                relative_file = str(pathlib.Path(*parts))
+                if relative_file in source_files or excluded.match(parts):
+                    continue
+                if file.endswith(".md") or included.match(parts):
+                    os.unlink(os.path.join(directory, file))
+                    deleted_files.add(relative_file)
+
+            # Remove empty directories, sub-directories being already cleaned
+            if directory_parts:
+                with contextlib.suppress(OSError):
+                    os.rmdir(directory)
+        return deleted_files
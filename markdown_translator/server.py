@@ -0,0 +1,223 @@
+"""
+Local translation service, keeping the HTML converter, hashes stores and
+caches warm between calls. Requests are handled one at a time, as they share
+the module configuration.
+
+Start it with: python -m markdown_translator.server --port 8787
+
+Every action is a POST request with a JSON object, answered with JSON. Its
+Content-Type must be application/json, which web pages cannot send to another
+origin without the agreement of the service, and its Host header a local
+address or the listening host, against DNS rebinding. With SERVER_TOKEN set,
+requests must also send it as "Authorization: Bearer <token>". Repositories
+are translated only within the roots given to the service, and /config only
+changes translation settings, not files written by updates nor the token.
+
+    /config             settings to change, as for config(...)
+    /translate          text, lang_to, lang_from -> markdown
+    /update             translation, hashes, new_version, lang_to, lang_from
+                        -> markdown, hashes
+    /repository/update  source, destination
+
+Prometheus metrics of the service are exposed on GET /metrics (see metrics.py).
+"""
+import argparse
+import hmac
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import inspect
+import json
+import os
+import pathlib
+import socketserver
+from . import Markdown, RepositoryTranslator
+from .configuration import config
+from .exceptions import MarkdownTranslatorError
+from .metrics import metrics
+
+# Settings changed by clients of the service, other ones being written paths
+# (REPORT_PATH, PROFILE_PATH, METRICS_PATH) or the service token
+CONFIG_SETTINGS = {
+    "API_KEY", "TRANSLATION_ENGINE", "SOURCE_LANG", "DEST_LANG", "VERSIONING",
+    "INCREMENTAL_PARSING", "STREAM_SIZE", "CHARACTERS_BUDGET", "TIME_BUDGET",
+    "SCHEDULING", "PRIORITY_FILES", "PRIORITY_LANGS", "SHARD_INDEX", "SHARD_COUNT",
+    "PROGRESS", "VERBOSE", "CODE_TRANSLATED", "SPLIT_SENTENCES", "KEEP_CLEAN",
+    "EDIT_LINKS", "URLS_ROOT", "INCLUDE_FILES", "EXCLUDE_FILES", "EXCLUDE_URLS",
+}
+
+class TranslationService:
+    """ Actions of the service, keeping repositories translators alive. """
+    def __init__(self, roots=None):
+        self.repository = None
+        self.repository_key = None
+        # Folders containing repositories the service may read and write
+        self.roots = [pathlib.Path(root).resolve() for root in roots or [os.getcwd()]]
+
+    def config(self, **settings):
+        if forbidden := [key for key in settings if key.upper() not in CONFIG_SETTINGS]:
+            raise MarkdownTranslatorError(
+                    f"Settings not available to the service: {', '.join(forbidden)}")
+        config(**settings)
+        return {"settings": list(settings)}
+
+    def translate(self, text, lang_to, lang_from=None):
+        translation = Markdown(text).translate(lang_to, lang_from)
+        return {"markdown": str(translation)}
+
+    def update(self, translation, hashes, new_version, lang_to, lang_from=None):
+        translated_md = Markdown(translation)
+        translated_md.blocks.refresh_hashes(hashes)
+        translated_md.update(Markdown(new_version), lang_to, lang_from)
+        return {"markdown": str(translated_md), "hashes": translated_md.blocks.hashes}
+
+    def repository_update(self, source, destination):
+        for path in (source, destination):
+            resolved = pathlib.Path(path).resolve()
+            if not any(resolved.is_relative_to(root) for root in self.roots):
+                raise MarkdownTranslatorError(f"Path outside of service roots: {path}")
+        # Hashes store of the destination is loaded again only on change of
+        # folders or settings, a new store being selected for the destination
+        key = (pathlib.Path(source), pathlib.Path(destination), config.revision)
+        if key != self.repository_key:
+            self.repository = RepositoryTranslator(source, destination)
+            self.repository_key = key
+        self.repository.update()
+        return {"source": source, "destination": destination}
+
+class TranslationRequestHandler(BaseHTTPRequestHandler):
+    routes = {
+        "/config": "config",
+        "/translate": "translate",
+        "/update": "update",
+        "/repository/update": "repository_update",
+    }
+
+    def do_GET(self):
+        if not self._allowed_host():
+            return self._answer(403, {"error": "Host not allowed"})
+        if self.path == "/health":
+            self._answer(200, {"status": "ok"})
+        elif self.path == "/metrics":
+            self._send(200, metrics.render().encode(), "text/plain; version=0.0.4")
+        else:
+            self._answer(404, {"error": f"Unknown path: {self.path}"})
+
+    def do_POST(self):
+        if not self._allowed_host():
+            return self._answer(403, {"error": "Host not allowed"})
+        if not self._authorized():
+            return self._answer(401, {"error": "Invalid or missing token"})
+        if self.path not in self.routes:
+            return self._answer(404, {"error": f"Unknown path: {self.path}"})
+        if self.headers.get_content_type() != "application/json":
+            return self._answer(415, {"error": "Content-Type must be application/json"})
+
+        action = getattr(self.server.service, self.routes[self.path])
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            arguments = json.loads(self.rfile.read(length) or "{}")
+            if not isinstance(arguments, dict):
+                raise ValueError("Arguments must be a JSON object")
+            inspect.signature(action).bind(**arguments)
+        except (ValueError, TypeError) as error:
+            return self._answer(400, {"error": str(error)})
+
+        try:
+            self._answer(200, action(**arguments))
+        except MarkdownTranslatorError as error:
+            self._answer(400, {"error": str(error)})
+        except Exception as error:
+            self._answer(500, {"error": f"{type(error).__name__}: {error}"})
+
+    def _allowed_host(self):
+        """ Reject requests for other host names, as after a DNS rebinding. """
+        if not self.client_address:
+            return True
+        host = self.headers.get("Host", "")
+        host = host[1:].partition("]")[0] if host.startswith("[") else host.partition(":")[0]
+        return host in self.server.allowed_hosts
+
+    def _authorized(self):
+        if not self.server.token:
+            return True
+        expected = f"Bearer {self.server.token}"
+        return hmac.compare_digest(self.headers.get("Authorization", ""), expected)
+
+    def _answer(self, status, content):
+        self._send(status, json.dumps(content).encode(), "application/json")
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Clients of unix sockets have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if config.VERBOSE:
+            super().log_message(format, *args)
+
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1"}
+
+class TranslationServer(HTTPServer):
+    def __init__(self, address, token="", roots=None):
+        super().__init__(address, TranslationRequestHandler)
+        self.service = TranslationService(roots)
+        self.token = token
+        self.allowed_hosts = LOCAL_HOSTS | {address[0]}
+        self.metrics = metrics.enable()
+
+    def server_close(self):
+        super().server_close()
+        if self.metrics:
+            metrics.disable()
+
+class UnixTranslationServer(socketserver.UnixStreamServer):
+    def __init__(self, path, token="", roots=None):
+        super().__init__(path, TranslationRequestHandler)
+        self.service = TranslationService(roots)
+        self.token = token
+        self.allowed_hosts = LOCAL_HOSTS
+        self.metrics = metrics.enable()
+
+    def server_close(self):
+        super().server_close()
+        if self.metrics:
+            metrics.disable()
+
+def create_server(host="127.0.0.1", port=8787, unix_socket=None, token=None, roots=None):
+    """
+    Create the service, listening on a local port or a unix socket. Token
+    defaults to SERVER_TOKEN setting, roots to the current directory.
+    """
+    if token is None:
+        token = config.SERVER_TOKEN
+    if unix_socket is not None:
+        if os.path.exists(unix_socket):
+            os.unlink(unix_socket)
+        return UnixTranslationServer(unix_socket, token, roots)
+    return TranslationServer((host, port), token, roots)
+
+def main():
+    parser = argparse.ArgumentParser(description="Local translation service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--unix-socket", default=None)
+    parser.add_argument("--root", action="append", dest="roots",
+                        help="Folder of translated repositories, current one by default")
+    arguments = parser.parse_args()
+
+    server = create_server(arguments.host, arguments.port, arguments.unix_socket,
+                           roots=arguments.roots)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import mistletoe
+from mistletoe.markdown_renderer import MarkdownRenderer
+from .chunks import code_fence
+from .renderers import mistletoe_lock, renderer_context
+
+def read_blocks(file, batch_size=65536):
+    """
+    Split top-level markdown blocks of a file handle incrementally, yielding
+    rendered blocks as Markdown._split_markdown would split them.
+
+    Lines are parsed by groups ending with a blank line, of at least batch_size
+    characters. Only the last parsed block stays pending, as following lines
+    may still belong to it. A pending block larger than the batch, as a long
+    loose list, is parsed again only once its size doubled, keeping the
+    parsing work linear in the file size.
+
+    Only the parsing is bounded by the batch and the largest block: rendered
+    blocks are yielded to be kept by the caller.
+    """
+    pending, pending_size, parse_size = [], 0, batch_size
+    for lines in _lines_groups(file):
+        pending.extend(lines)
+        pending_size += sum(map(len, lines))
+        if pending_size < parse_size:
+            continue
+
+        with mistletoe_lock:
+            children = mistletoe.Document(pending).children
+            blocks = _render_blocks(children[:-1])
+        if not blocks:
+            parse_size = 2 * pending_size
+            continue
+        yield from blocks
+        pending = pending[children[-1].line_number - 1:]
+        pending_size = sum(map(len, pending))
+        parse_size = pending_size + batch_size
+    # Ignore trailing spaces of the document, as stripped texts
+    while pending and not pending[-1].strip():
+        pending.pop()
+    if pending:
+        with mistletoe_lock:
+            blocks = _render_blocks(mistletoe.Document(pending).children)
+        yield from blocks
+
+def _lines_groups(file):
+    """ Group lines until a blank line, outside of code fences. """
+    lines, fence, started = [], None, False
+    for line in file:
+        # Ignore leading spaces of the document, as stripped texts
+        if not started:
+            if not line.strip():
+                continue
+            line, started = line.lstrip(), True
+
+        lines.append(line)
+        fence = code_fence(fence, line)
+        if not fence and not line.strip():
+            yield lines
+            lines = []
+    if lines:
+        yield lines
+
+def _render_blocks(blocks):
+    """ Rendered blocks, not yielded while holding mistletoe_lock. """
+    with renderer_context(MarkdownRenderer) as renderer:
+        return [renderer.render(block).strip() for block in blocks]
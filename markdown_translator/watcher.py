@@ -0,0 +1,173 @@
+import os
+import pathlib
+import select
+import struct
+import sys
+import time
+from .paths import walk_files
+
+class PollingWatcher:
+    """
+    Detect files modifications of a folder, comparing modification times and
+    sizes of files between explorations.
+    """
+    def __init__(self, folder, excluded, included):
+        self.folder = pathlib.Path(folder)
+        self.excluded = excluded
+        self.included = included
+        self.snapshot = self._snapshot()
+
+    def changes(self, timeout):
+        """ Wait during timeout seconds, then get modified files. """
+        time.sleep(timeout)
+        snapshot = self._snapshot()
+        changed = {file for file in snapshot.keys() | self.snapshot.keys() \
+                        if snapshot.get(file) != self.snapshot.get(file)}
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+    def _snapshot(self):
+        snapshot = {}
+        for file in walk_files(self.folder, self.excluded, self.included):
+            try:
+                stat = (self.folder / file).stat()
+            except FileNotFoundError:
+                continue
+            snapshot[file] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+class InotifyWatcher:
+    """
+    Detect files modifications of a folder with Linux inotify, watching every
+    directory of the folder except excluded ones.
+
+    Known files are kept to report files of directories moved out or deleted,
+    and deleted files when events were lost on a queue overflow, the folder
+    being explored again.
+    """
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_Q_OVERFLOW = 0x4000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    EVENTS = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self, folder, excluded, included):
+        import ctypes
+        import ctypes.util
+        self.folder = pathlib.Path(folder)
+        self.excluded = excluded
+        self.included = included
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify initialization failed")
+        self.directories = {}
+        self.files = self._watch_tree(())
+
+    def changes(self, timeout):
+        """ Wait at most timeout seconds for events, then get modified files. """
+        changed = set()
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return changed
+
+        data = self._read_events()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & self.IN_Q_OVERFLOW:
+                changed |= self._rescan()
+                continue
+            if wd not in self.directories or not name:
+                continue
+
+            parts = self.directories[wd] + (name,)
+            if self.excluded.match_end(parts):
+                continue
+            if mask & self.IN_ISDIR:
+                # Files of a new directory are not notified, list them
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    new_files = self._watch_tree(parts)
+                    self.files |= new_files
+                    changed |= new_files
+                elif mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                    changed |= self._unwatch_tree(parts)
+            elif name.endswith(".md") or self.included.match(parts):
+                path = pathlib.Path(*parts)
+                if mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                    self.files.discard(path)
+                else:
+                    self.files.add(path)
+                changed.add(path)
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def _read_events(self):
+        data = b""
+        while True:
+            try:
+                data += os.read(self.fd, 65536)
+            except BlockingIOError:
+                return data
+
+    def _rescan(self):
+        """ Explore the folder again, once events were lost. """
+        files = self._watch_tree(())
+        changed = files | self.files
+        self.files = files
+        return changed
+
+    def _unwatch_tree(self, parts):
+        """ Forget a directory moved out or deleted, return its known files. """
+        for wd, directory_parts in list(self.directories.items()):
+            if directory_parts[:len(parts)] == parts:
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.directories[wd]
+        removed = {file for file in self.files if file.parts[:len(parts)] == parts}
+        self.files -= removed
+        return removed
+
+    def _watch_tree(self, parts):
+        """ Watch a directory and its sub-directories, listing their files. """
+        directory = self.folder.joinpath(*parts)
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.EVENTS)
+        if wd < 0:
+            return set()
+        self.directories[wd] = parts
+
+        files = set()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                entry_parts = parts + (entry.name,)
+                if self.excluded.match_end(entry_parts):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    files |= self._watch_tree(entry_parts)
+                elif entry.name.endswith(".md") or self.included.match(entry_parts):
+                    files.add(pathlib.Path(*entry_parts))
+        return files
+
+def create_watcher(folder, excluded, included, polling=False):
+    """ Get an inotify watcher when available, else a polling watcher. """
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(folder, excluded, included)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(folder, excluded, included)
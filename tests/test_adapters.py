@@ -1,6 +1,12 @@
+import io
+import json
+import logging
+import multiprocessing
 import markdown_translator
 from markdown_translator import RepositoryTranslator, config, adapters
 from markdown_translator.adapters.hashes_adapters import *
+from markdown_translator.files import bulk_writes, update_json
+from markdown_translator.progress import Progress
 from utils_tests import *
 
 def test_adapters_parent_class(tmp_path):
@@ -114,3 +120,170 @@ def test_repo_translator_with_adapter(tmp_path, mode):
     result_hashes = adapters.hashes.get(filename)
 
     assert result_hashes == expected_hashes
+
+@pytest.mark.parametrize("adapter_class", get_hashes_adapters())
+def test_adapters_sentences(tmp_path, adapter_class):
+    translations = {"hash1": "Première phrase.", "hash2": "Seconde phrase."}
+    adapter = adapter_class(tmp_path)
+    adapter.set_sentences("fr", translations)
+    del adapter
+
+    # Sentences are stored by language, and persist
+    new_adapter = adapter_class(tmp_path)
+    assert new_adapter.get_sentence("fr", "hash1") == "Première phrase."
+    assert new_adapter.get_sentence("fr", "hash2") == "Seconde phrase."
+    assert new_adapter.get_sentence("es", "hash1") == None
+    assert new_adapter.get_sentence("fr", "unexisting") == None
+    assert new_adapter.sentences_items() == [("fr", translations)]
+
+    new_adapter.set_sentences("es", {"hash1": "Primera frase."})
+    new_adapter.prune_sentences({"hash1"})
+    assert sorted(adapter_class(tmp_path).sentences_items()) == [
+        ("es", {"hash1": "Primera frase."}), ("fr", {"hash1": "Première phrase."})]
+
+@pytest.mark.parametrize("adapter_class", get_hashes_adapters())
+def test_adapters_delete_many(tmp_path, adapter_class):
+    adapter = adapter_class(tmp_path)
+    for number in range(5):
+        adapter.set(f"somefile-{number}", [f"hash-{number}"])
+
+    adapter.delete_many(["somefile-1", "somefile-3", "unexisting"])
+    del adapter
+
+    new_adapter = adapter_class(tmp_path)
+    assert new_adapter.get("somefile-1") == None
+    assert new_adapter.get("somefile-3") == None
+    assert new_adapter.get("somefile-0") == ["hash-0"]
+    assert new_adapter.get("somefile-4") == ["hash-4"]
+
+@pytest.mark.parametrize("adapter_class", get_hashes_adapters())
+def test_adapters_set_many(tmp_path, adapter_class):
+    adapter = adapter_class(tmp_path)
+    adapter.set("somefile-0", ["old-hash"])
+    adapter.set_many({f"somefile-{number}": [f"hash-{number}"] for number in range(3)})
+    del adapter
+
+    new_adapter = adapter_class(tmp_path)
+    assert sorted(new_adapter.items()) == [
+        (f"somefile-{number}", [f"hash-{number}"]) for number in range(3)]
+
+def test_schedulers(tmp_path):
+    source_folder = tmp_path / "source"
+    create_structure(source_folder, {
+        'long.md': 'A long paragraph to translate.',
+        'folder': {'short.md': 'Short.'},
+        })
+    config(dest_lang=["fr", "es"], include_files=[], exclude_files=[])
+    plan = RepositoryTranslator(source_folder, tmp_path / "destination").plan()
+    units = lambda ordered: [(str(unit.file_plan.relative_source), unit.lang)
+                                for unit in ordered]
+
+    assert units(adapters.schedule_smallest(plan.units))[:2] == [
+        ("folder/short.md", "fr"), ("folder/short.md", "es")]
+
+    try:
+        config(priority_files=["long.md"], priority_langs=["es"])
+        assert units(adapters.prioritize(adapters.schedule_smallest(plan.units))) == [
+            ("long.md", "es"), ("long.md", "fr"),
+            ("folder/short.md", "es"), ("folder/short.md", "fr"),
+            ]
+        config(priority_files=["folder"], priority_langs=["ES"])
+        assert units(adapters.prioritize(plan.units))[:2] == [
+            ("folder/short.md", "es"), ("folder/short.md", "fr")]
+    finally:
+        config(priority_files=[], priority_langs=[])
+
+    # Files deleted since planned are scheduled last
+    (source_folder / "long.md").unlink()
+    assert units(adapters.schedule_recent(plan.units))[-2:] == [
+        ("long.md", "fr"), ("long.md", "es")]
+
+@disable_translation
+def test_progress_sinks(tmp_path, caplog):
+    source_folder = tmp_path / "source"
+    create_structure(source_folder, {'file.md': 'Some paragraph.'})
+    config(dest_lang=["fr", "es"], include_files=[], exclude_files=[], keep_clean=False)
+    plan = RepositoryTranslator(source_folder, tmp_path / "destination").plan()
+
+    stream = io.StringIO()
+    progress = Progress(lambda progress: adapters.progress_bar(progress, stream))
+    progress.plan(plan.pending)
+    progress.begin()
+    assert "0/2 files" in stream.getvalue()
+    for unit in plan.units:
+        progress.advance(unit)
+    progress.finish()
+    assert "2/2 files" in stream.getvalue()
+    assert stream.getvalue().endswith("\n")
+
+    with caplog.at_level(logging.INFO, logger="markdown_translator.progress"):
+        adapters.progress_log(progress)
+    assert [record.getMessage().split(":")[0] for record in caplog.records][:2] == \
+                ["fr", "es"]
+
+def test_adapters_json_bulk_writes(tmp_path):
+    adapter = BlockHashesJSONAdapter(tmp_path)
+    adapter.set("kept.md", ["hash"])
+    writes = []
+    hook = lambda stage, duration, details: writes.append(stage)
+    markdown_translator.instrumentation.add_hook(hook)
+    try:
+        with bulk_writes():
+            for number in range(10):
+                adapter.set(f"somefile-{number}", [f"hash-{number}"])
+            adapter.delete("somefile-0")
+            # Changes are visible before being written, once at the end
+            assert adapter.get("somefile-1") == ["hash-1"]
+            assert adapter.get("somefile-0") is None
+            assert len(adapter.items()) == 10
+            assert json.loads((tmp_path / "hashes.json").read_text()) == {"kept.md": ["hash"]}
+    finally:
+        markdown_translator.instrumentation.remove_hook(hook)
+    assert writes.count("hashes.write") == 1
+
+    # Sentences are also written once, pruned entries included
+    writes.clear()
+    markdown_translator.instrumentation.add_hook(hook)
+    try:
+        with bulk_writes():
+            for number in range(10):
+                adapter.set_sentences("fr", {f"sentence-{number}": f"Phrase {number}."})
+            adapter.prune_sentences({"sentence-1", "sentence-2"})
+            assert adapter.get_sentence("fr", "sentence-3") == "Phrase 3."
+            assert not (tmp_path / "sentences.json").exists()
+    finally:
+        markdown_translator.instrumentation.remove_hook(hook)
+    assert writes.count("hashes.write") == 1
+    assert json.loads((tmp_path / "sentences.json").read_text()) == {
+        "fr": {"sentence-1": "Phrase 1.", "sentence-2": "Phrase 2."}}
+    (tmp_path / "sentences.json").unlink()
+    assert sorted(BlockHashesJSONAdapter(tmp_path).items()) == sorted(adapter.items())
+
+    # A failed write leaves the file as it was
+    content = (tmp_path / "hashes.json").read_text()
+    with pytest.raises(TypeError):
+        update_json(tmp_path / "hashes.json", lambda data: data.update(broken=object()))
+    assert (tmp_path / "hashes.json").read_text() == content
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["hashes.json"]
+
+def _store_entries(adapter_class, folder, worker):
+    adapter = adapter_class(folder)
+    for number in range(20):
+        adapter.set(f"{worker}-{number}", [f"hash-{number}"])
+    adapter.delete(f"{worker}-0")
+
+@pytest.mark.parametrize("adapter_class", get_hashes_adapters())
+def test_adapters_concurrent_processes(tmp_path, adapter_class):
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_store_entries, args=(adapter_class, tmp_path, worker))
+                    for worker in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+
+    entries = dict(adapter_class(tmp_path).items())
+    assert len(entries) == 4 * 19
+    assert entries["3-19"] == ["hash-19"]
+    assert "3-0" not in entries
@@ -0,0 +1,24 @@
+import json
+import subprocess
+import sys
+
+# Dependencies only needed once translating, not to import the module
+HEAVY_MODULES = ["requests", "mistletoe", "sqlite3", "subprocess", "ctypes",
+                 "concurrent.futures"]
+
+def run_python(code):
+    result = subprocess.run([sys.executable, "-c", code],
+                            capture_output=True, text=True, check=True)
+    return result.stdout
+
+def test_lazy_imports():
+    stdout = run_python(
+        "import sys, json\n"
+        "import markdown_translator\n"
+        "from markdown_translator import config, adapters\n"
+        f"print(json.dumps([name for name in {HEAVY_MODULES} if name in sys.modules]))\n"
+        "print(json.dumps('_loaded' in vars(config)))\n"
+        )
+    imported, config_loaded = map(json.loads, stdout.splitlines())
+    assert imported == []
+    assert config_loaded is False
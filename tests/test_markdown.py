@@ -1,8 +1,21 @@
 from datetime import datetime
+import io
 import json
+import os
 import pathlib
+import threading
+import mistletoe
 import pytest
 from markdown_translator import Markdown, config, adapters
+from markdown_translator.markdown_blocks import split_sentences
+from markdown_translator.links import link_rules
+from markdown_translator.stream import read_blocks
+from markdown_translator.chunks import ChunksCache, split_chunks
+from markdown_translator.files import bulk_writes
+from markdown_translator.exceptions import MarkdownTranslatorError
+from markdown_translator import markdown
+from markdown_translator.renderers import CodeDisabledHTMLRenderer, renderer_context
+import mistletoe
 from utils_tests import *
 
 # To test :
@@ -46,6 +59,38 @@ With a nice paragraph.
     assert not markdown_file.exists()
     assert saved_hashes == None
 
+def test_markdown_save_unchanged(tmp_path):
+    markdown_file = tmp_path / "folder" / "test.md"
+    md = Markdown(text="# A nice title\n\nWith a nice paragraph.")
+    assert md.save(markdown_file, save_hashes=False)
+    markdown_file.chmod(0o640)
+    modification_time = markdown_file.stat().st_mtime_ns
+
+    # Identical content is not written again
+    assert not Markdown(filename=markdown_file).save(save_hashes=False)
+    assert markdown_file.stat().st_mtime_ns == modification_time
+
+    # Modified content replace the file, keeping permissions
+    with bulk_writes():
+        md = Markdown(text="# A nice title\n\nWith a modified paragraph.")
+        assert md.save(markdown_file, save_hashes=False)
+    assert markdown_file.read_text() == "# A nice title\n\nWith a modified paragraph.\n"
+    assert markdown_file.stat().st_mode & 0o777 == 0o640
+    assert [file.name for file in markdown_file.parent.iterdir()] == ["test.md"]
+
+    # Same text with other newlines is normalized
+    markdown_file.write_bytes(markdown_file.read_bytes().replace(b"\n", b"\r\n"))
+    assert Markdown(filename=markdown_file).save(save_hashes=False)
+    assert b"\r" not in markdown_file.read_bytes()
+
+    # New files get default permissions
+    umask = os.umask(0o027)
+    try:
+        md.save(tmp_path / "folder" / "new.md", save_hashes=False)
+    finally:
+        os.umask(umask)
+    assert (tmp_path / "folder" / "new.md").stat().st_mode & 0o777 == 0o640
+
 def test_markdown_block(create_markdown_file):
     content = "# Test title"
     expected_blocks = {
@@ -170,6 +215,213 @@ code block
     md = Markdown(filename=markdown_file)
     assert md.html.strip() == expected_html.strip()
 
+def test_markdown_stream(create_markdown_file):
+    content = """
+
+  Setext title
+============
+
+- Loose list
+
+- with items
+
+    continued
+
+```python
+code block
+
+with blank lines
+```
+
+Lazy paragraph
+continuation
+> Quote
+
+    indented code
+
+Last paragraph
+    """
+    markdown_file = create_markdown_file(content)
+    expected_md = Markdown(filename=markdown_file)
+
+    with open(markdown_file) as file:
+        assert list(read_blocks(file, batch_size=1)) == \
+                                list(expected_md.blocks.childrens.values())
+
+    config(stream_size=1)
+    md = Markdown(filename=markdown_file)
+    config(stream_size=0)
+    assert md.blocks.childrens == expected_md.blocks.childrens
+    assert md.blocks.hashes == expected_md.blocks.hashes
+
+def test_markdown_concurrent_parsing():
+    text = "# Title\n\nParagraph with a [link][ref].\n\n[ref]: /page.md\n\n- item\n- item\n"
+    expected = Markdown(text)
+    errors = []
+    def parse():
+        try:
+            for _ in range(200):
+                md = Markdown(text)
+                assert md.blocks.hashes == expected.blocks.hashes
+                assert md.html == expected.html
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=parse) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+def test_markdown_stream_large_block(monkeypatch):
+    # A single loose list larger than the batch, followed by a paragraph
+    items = [f"- Item {number}\n\n" for number in range(2000)]
+    content = "".join(items) + "Last paragraph\n"
+    expected_blocks = list(Markdown(text=content).blocks.childrens.values())
+
+    parsed_lines = []
+    document = mistletoe.Document
+    def counted_document(lines):
+        parsed_lines.append(len(lines))
+        return document(lines)
+    monkeypatch.setattr(mistletoe, "Document", counted_document)
+
+    blocks = list(read_blocks(io.StringIO(content), batch_size=256))
+    assert blocks == expected_blocks
+    # Parsed again only when doubled, not on each group of lines
+    assert sum(parsed_lines) < 4 * content.count("\n")
+
+def test_markdown_stream_standardize(create_markdown_file, monkeypatch):
+    content = "\n\n".join(f"Paragraph {number}." for number in range(20))
+    markdown_file = create_markdown_file(content)
+    converted = []
+    def html_to_markdown(html_text):
+        converted.append(html_text)
+        return html_text.replace("<p>", "").replace("</p>\n", "\n\n")
+    monkeypatch.setattr(Markdown, "html_to_markdown", staticmethod(html_to_markdown))
+    expected_md = Markdown(filename=markdown_file)
+    expected_md.standardize()
+    html_text = converted.pop()
+
+    config(stream_size=40)
+    try:
+        md = Markdown(filename=markdown_file)
+        md.standardize()
+    finally:
+        config(stream_size=0)
+    assert md.blocks.hashes == expected_md.blocks.hashes
+    # Converted by groups of blocks, not the whole content at once
+    assert len(converted) == 5
+    assert "".join(converted) == html_text
+
+def test_markdown_chunks():
+    paragraphs = [f"Paragraph {number} with some content." * 5 for number in range(100)]
+    content = "# Title\n\n" + "\n\n".join(paragraphs) + """
+
+- Loose list
+
+- with items
+
+```python
+code block
+
+with blank lines
+```
+
+    indented code
+
+    with blank lines
+"""
+    chunks = split_chunks(content, min_size=256)
+    assert "".join(chunks) == content
+    assert 1 < len(chunks) < 100
+
+    # Boundaries do not move outside of an edited chunk
+    edited_content = content.replace("Paragraph 50 ", "Paragraph fifty ")
+    edited_chunks = split_chunks(edited_content, min_size=256)
+    assert len(set(edited_chunks) - set(chunks)) == 1
+
+    # Parse only modified chunks, with the same blocks
+    expected_md = Markdown(text=content)
+    config(incremental_parsing=True)
+    markdown.parsed_chunks.clear()
+    md = Markdown(text=content)
+    parsed_count = len(markdown.parsed_chunks.results)
+    Markdown(text=edited_content)
+    config(incremental_parsing=False)
+
+    assert md.blocks.childrens == expected_md.blocks.childrens
+    assert md.blocks.hashes == expected_md.blocks.hashes
+    assert len(markdown.parsed_chunks.results) == parsed_count + 1
+
+def test_markdown_chunks_cache_counters():
+    cache = ChunksCache()
+    chunks = [f"Paragraph {number}." for number in range(100)]
+    def lookup():
+        for _ in range(10):
+            for chunk in chunks:
+                cache.get(chunk, str.upper)
+
+    threads = [threading.Thread(target=lookup) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    counters = cache.counters()
+    assert counters["lookups"] == 4000
+    assert len(chunks) <= counters["misses"] <= 4 * len(chunks)
+
+def test_markdown_chunks_nested_fences():
+    # Markdown documentation in a tilde fence, with backtick fences inside
+    example = "".join(f"Open code block {number} with:\n\n```python\n\n"
+                      f"and close code block {number} with:\n\n```\n\n"
+                        for number in range(20))
+    content = f"# Title\n\n~~~markdown\n{example}~~~\n\nLast paragraph\n"
+    assert len(split_chunks(content, min_size=64)) == 1
+
+    expected_md = Markdown(text=content)
+    assert len(expected_md.blocks) == 3
+    config(incremental_parsing=True)
+    md = Markdown(text=content)
+    config(incremental_parsing=False)
+    assert md.blocks.childrens == expected_md.blocks.childrens
+
+    assert list(read_blocks(io.StringIO(content), batch_size=1)) == \
+                list(expected_md.blocks.childrens.values())
+
+    # Closing fences are at least as long as the opening one
+    content = "````\n```\n\ncode\n````\n\nParagraph\n"
+    assert len(split_chunks(content, min_size=1)) == 1
+
+def test_markdown_html_fragments():
+    content = """
+# Heading
+
+Paragraph with `code` and <span>html</span>.
+
+<div>
+<img src="/media/image.jpg"/>
+</div>
+
+1. First
+2. Second
+
+| Table | Header |
+|-------|--------|
+| cell  | cell   |
+    """
+    md = Markdown(text=content)
+    expected_html = mistletoe.markdown(str(md), CodeDisabledHTMLRenderer)
+    assert md.html == expected_html
+    assert md.html == expected_html
+
+    # Renderers are reused in the same thread
+    with renderer_context(CodeDisabledHTMLRenderer) as renderer:
+        first_renderer = renderer
+    with renderer_context(CodeDisabledHTMLRenderer) as renderer:
+        assert renderer is first_renderer
+
 def test_markdown_standardization(create_markdown_file):
     content = """
 The title
@@ -258,6 +510,31 @@ def test_markdown_with_multi_html(create_markdown_file):
     assert md.blocks.childrens == expected_blocks
     assert md.blocks.hashes == expected_hashes
 
+def test_markdown_split_sentences():
+    content = "First sentence. Second one!\nA [link. Text](/a/b.md) and " \
+              "`code. inline`? Numbers like 1. or e.g. initials J. Doe stay."
+    expected_sentences = [
+        "First sentence.",
+        "Second one!",
+        "A [link. Text](/a/b.md) and `code. inline`?",
+        "Numbers like 1. or e.g. initials J. Doe stay.",
+    ]
+    expected_separators = [" ", "\n", " "]
+
+    sentences, separators = split_sentences(content)
+    assert sentences == expected_sentences
+    assert separators == expected_separators
+
+    # Emphasis and inline HTML elements are kept whole
+    assert split_sentences("**Important. Read this.** Then go. Last one.")[0] == [
+        "**Important. Read this.** Then go.", "Last one."]
+    assert split_sentences("Some *emphasis. Here* and ~~old. Text~~ end. Last.")[0] == [
+        "Some *emphasis. Here* and ~~old. Text~~ end.", "Last."]
+    assert split_sentences("<span>one. two.</span> three. Then <br> four. Last.")[0] == [
+        "<span>one. two.</span> three.", "Then <br> four.", "Last."]
+    assert split_sentences("A snake_case name. And `a*b` code. Last.")[0] == [
+        "A snake_case name.", "And `a*b` code.", "Last."]
+
 @disable_translation
 def test_markdown_link_edit():
     content = """
@@ -340,6 +617,27 @@ To specified [translation folder](/translations/en/link).
     assert translation.blocks.childrens == expected_blocks
     assert translation.blocks.hashes == list(expected_blocks.keys())
 
+def test_markdown_link_rules():
+    config(urls_root="/translations", dest_lang=["en", "FR"], edit_links=True,
+           exclude_urls=["/static", "/api/v1"])
+    rules = link_rules()
+    assert rules.is_editable("/one/absolute/path")
+    assert rules.is_editable("/api/v2/page")
+    assert not rules.is_editable("relative/path")
+    assert not rules.is_editable("https://www.wikipedia.org/")
+    assert not rules.is_editable("/static/image.png")
+    assert not rules.is_editable("/api/v1/page")
+    assert not rules.is_editable("/README.md")
+    assert not rules.is_editable("/translations/en/link")
+    assert not rules.is_editable("/fr/link")
+    assert link_rules() is rules
+
+    # Rules are compiled again when the configuration changed
+    config(exclude_urls=[], edit_links=False)
+    assert link_rules() is not rules
+    assert not link_rules().is_editable("/one/absolute/path")
+    config(urls_root="/", dest_lang=[], edit_links=True)
+
 def test_markdown_translate():
     content = "# An easy title"
     expected_blocks = {
@@ -428,3 +726,16 @@ Paragraphe 3.
 
     assert old_translated.blocks.childrens == expected_blocks
     assert old_translated.blocks.hashes == new_version.blocks.hashes
+
+def test_markdown_settings_snapshot():
+    settings = config.snapshot(translation_engine="disabled", dest_lang=["fr"])
+    with pytest.raises(MarkdownTranslatorError):
+        settings.DEST_LANG = ["es"]
+    with pytest.raises(MarkdownTranslatorError):
+        config.snapshot(unexisting_setting=True)
+    assert settings.DEST_LANG == ("fr",)
+
+    markdown = Markdown("[Link](/page.md)", settings=settings)
+    translation = markdown.translate("fr")
+    assert translation.settings is settings
+    assert str(translation) == "[Link](/fr/page.md)"
@@ -1,7 +1,22 @@
 from pathlib import Path
+import json
+import os
+import pstats
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
 import pytest
 import markdown_translator
-from markdown_translator import RepositoryTranslator
+from markdown_translator import RepositoryTranslator, instrumentation
+from markdown_translator.metrics import metrics
+from markdown_translator.paths import PathsMatcher, shard_index, walk_files
+from markdown_translator.plan import partial_key
+from markdown_translator.progress import Progress
+from markdown_translator.watcher import InotifyWatcher
+from markdown_translator.exceptions import MarkdownTranslatorError
 from utils_tests import *
 
 @pytest.fixture(scope="module", autouse=True)
@@ -542,3 +557,758 @@ def test_repo_translator_content_update(tmp_path):
 
     result_structure = convert_to_dict(dest_folder)
     assert result_structure == expected_structure
+
+@disable_translation
+def test_repo_translator_plan(tmp_path):
+    test_structure = {
+        'updated.md': '# Title\n\nNew paragraph.',
+        'not-updated.md': 'Still same paragraph.',
+    }
+    old_structure = {
+        'fr': {
+            'updated.md': '# Title',
+            'not-updated.md': 'Still same paragraph.',
+        },
+    }
+    source_folder = str(tmp_path / "source")
+    dest_folder = str(tmp_path / "destination")
+    create_structure(source_folder, test_structure)
+    create_structure(dest_folder, old_structure)
+
+    markdown_translator.config(
+                dest_lang=["fr"],
+                include_files=[],
+                exclude_files=[],
+                keep_clean=False,
+                )
+    repo = RepositoryTranslator(source_folder, dest_folder)
+    plan = repo.plan()
+
+    # Nothing is written while planning
+    assert convert_to_dict(dest_folder)["fr"]["updated.md"] == "# Title"
+    assert plan.to_dict() == {
+        "files": 2,
+        "source_lang": markdown_translator.config.SOURCE_LANG,
+        "blocks": 1,
+        "characters": len("<p>New paragraph.</p>\n"),
+        "requests": 1,
+        "units": [{
+            "file": "updated.md",
+            "lang": "fr",
+            "blocks": 1,
+            "characters": len("<p>New paragraph.</p>\n"),
+            "requests": 1,
+        }],
+    }
+
+    repo.update(plan)
+    assert convert_to_dict(dest_folder)["fr"] == {
+        'updated.md': '# Title\n\nNew paragraph.',
+        'not-updated.md': 'Still same paragraph.',
+    }
+    assert repo.plan().requests == 0
+
+@disable_translation
+def test_repo_translator_budget(tmp_path):
+    source_folder = str(tmp_path / "source")
+    dest_folder = tmp_path / "destination"
+    create_structure(source_folder, {'file.md': 'Some paragraph.'})
+
+    versioning = markdown_translator.config.VERSIONING
+    markdown_translator.config(
+                dest_lang=["fr", "es"],
+                include_files=[],
+                exclude_files=[],
+                keep_clean=False,
+                versioning="json",
+                characters_budget=len("<p>Some paragraph.</p>\n"),
+                )
+    try:
+        plan = RepositoryTranslator(source_folder, dest_folder).update()
+        assert [unit.lang for unit in plan.pending] == ["es"]
+        assert convert_to_dict(dest_folder / "fr") == {'file.md': 'Some paragraph.'}
+        assert not (dest_folder / "es").exists()
+        hashes = json.loads((dest_folder / "hashes.json").read_text())
+        assert list(hashes) == ["fr:file.md"]
+
+        # Next run resumes with postponed languages only
+        repo = RepositoryTranslator(source_folder, dest_folder)
+        assert [unit.lang for unit in repo.plan().units if unit.requests] == ["es"]
+        assert repo.update().pending == []
+        assert convert_to_dict(dest_folder / "es") == {'file.md': 'Some paragraph.'}
+        hashes = json.loads((dest_folder / "hashes.json").read_text())
+        assert list(hashes) == ["file.md"]
+    finally:
+        markdown_translator.config(versioning=versioning, characters_budget=0)
+
+@disable_translation
+def test_repo_translator_budget_not_reached(tmp_path, capsys):
+    source_folder = tmp_path / "source"
+    create_structure(source_folder, {
+        f'file{number}.md': f'Paragraph {number}.' for number in range(4)})
+    markdown_translator.config(
+                dest_lang=["fr"],
+                include_files=[],
+                exclude_files=[],
+                keep_clean=False,
+                characters_budget=len("<p>Paragraph 0.</p>\n"),
+                )
+    verbose = markdown_translator.config.VERBOSE
+    markdown_translator.config(verbose=True)
+    try:
+        plan = RepositoryTranslator(source_folder, tmp_path / "destination").update()
+    finally:
+        markdown_translator.config(verbose=verbose, characters_budget=0)
+
+    # Files after the stop point are reported, though not planned
+    assert len(plan.files) == 1 and plan.pending == []
+    assert "Budget exhausted: 0 translations postponed, 3 files not reached" \
+                in capsys.readouterr().out
+
+@disable_translation
+def test_repo_translator_sentences_pruned(tmp_path):
+    source_folder = tmp_path / "source"
+    dest_folder = tmp_path / "destination"
+    create_structure(source_folder, {'file.md': 'First sentence. Second sentence.'})
+    versioning = markdown_translator.config.VERSIONING
+    markdown_translator.config(
+                dest_lang=["fr"],
+                include_files=[],
+                exclude_files=[],
+                keep_clean=False,
+                versioning="json",
+                split_sentences=True,
+                )
+    try:
+        repo = RepositoryTranslator(source_folder, dest_folder)
+        markdown_translator.adapters.hashes.set_sentences("fr", {"stale": "Ancienne phrase."})
+        repo.update()
+        (source_folder / "file.md").write_text("First sentence. Third sentence.")
+        repo.update()
+    finally:
+        markdown_translator.config(versioning=versioning, split_sentences=False)
+
+    sentences = json.loads((dest_folder / "sentences.json").read_text())
+    assert sorted(sentences["fr"].values()) == ["First sentence.", "Third sentence."]
+
+@disable_translation
+def test_repo_translator_budget_oversized(tmp_path):
+    source_folder = tmp_path / "source"
+    dest_folder = tmp_path / "destination"
+    create_structure(source_folder, {
+        'big.md': 'A paragraph too long for the whole budget.',
+        'small.md': 'Short.',
+        })
+    markdown_translator.config(
+                dest_lang=["fr", "es"],
+                include_files=[],
+                exclude_files=[],
+                keep_clean=False,
+                characters_budget=2 * len("<p>Short.</p>\n"),
+                )
+    repo = RepositoryTranslator(source_folder, dest_folder)
+    try:
+        # Units exceeding the budget are postponed, smaller ones still translated
+        plan = repo.update()
+        assert sorted((str(unit.file_plan.relative_source), unit.lang)
+                        for unit in plan.pending) == [("big.md", "es"), ("big.md", "fr")]
+        assert convert_to_dict(dest_folder / "fr") == {'small.md': 'Short.'}
+    finally:
+        markdown_translator.config(characters_budget=0)
+
+    # The returned plan resumes with pending units only
+    events = []
+    hook = lambda stage, duration, details: events.append((stage, details))
+    instrumentation.add_hook(hook)
+    try:
+        assert repo.update(plan).pending == []
+    finally:
+        instrumentation.remove_hook(hook)
+    assert [details["file"] for stage, details in events if stage == "translate_unit"] \
+                == ["big.md", "big.md"]
+    assert convert_to_dict(dest_folder / "es") == {
+        'big.md': 'A paragraph too long for the whole budget.', 'small.md': 'Short.'}
+
+@disable_translation
+def test_repo_translator_shards(tmp_path):
+    test_structure = {
+        f'file{index}.md': f'Paragraph {index}.' for index in range(8)
+    }
+    test_structure['folder'] = {'nested.md': 'Nested paragraph.'}
+    source_folder = str(tmp_path / "source")
+    create_structure(source_folder, test_structure)
+    create_structure(tmp_path / "destination", {'fr': {'removed.md': 'Removed.'}})
+
+    markdown_translator.config(
+                dest_lang=["fr"],
+                include_files=[],
+                exclude_files=[],
+                keep_clean=True,
+                shard_count=2,
+                )
+    shard_folders = []
+    try:
+        for index in range(2):
+            markdown_translator.config(shard_index=index)
+            shard_folder = tmp_path / f"shard{index}"
+            shutil.copytree(tmp_path / "destination", shard_folder)
+            shard_plan = RepositoryTranslator(source_folder, shard_folder).plan()
+            assert all(shard_index(file_plan.relative_source, 2) == index
+                            for file_plan in shard_plan.files)
+            RepositoryTranslator(source_folder, shard_folder).update(shard_plan)
+            shard_folders.append(shard_folder)
+            shard_store = adapters.hashes.adapter(markdown_translator.config.VERSIONING)(
+                                shard_folder)
+            shard_store.set_sentences("fr", {f"sentence{index}": f"Phrase {index}."})
+    finally:
+        markdown_translator.config(shard_index=0, shard_count=1)
+    # Language translated by a shard stopped early
+    partial_file = next(f'file{index}.md' for index in range(8)
+                            if shard_index(f'file{index}.md', 2) == 1)
+    shard_store.set(partial_key("fr", partial_file), ["hash"])
+
+    repo = RepositoryTranslator(source_folder, tmp_path / "destination")
+    repo.merge_shards(shard_folders)
+    assert convert_to_dict(tmp_path / "destination" / "fr") == test_structure
+    for file in ["file0.md", "file7.md", "folder/nested.md"]:
+        assert adapters.hashes.get(file) is not None
+    assert adapters.hashes.get(partial_key("fr", partial_file)) == ["hash"]
+    adapters.hashes.delete(partial_key("fr", partial_file))
+    assert [adapters.hashes.get_sentence("fr", f"sentence{index}")
+                for index in range(2)] == ["Phrase 0.", "Phrase 1."]
+    assert repo.plan().requests == 0
+
+    # Unchanged translations are not written again
+    modified = {file: file.stat().st_mtime_ns
+                    for file in (tmp_path / "destination" / "fr").rglob("*.md")}
+    repo.merge_shards(shard_folders)
+    assert modified == {file: file.stat().st_mtime_ns for file in modified}
+
+def test_repo_translator_snapshots(tmp_path):
+    source_folder = tmp_path / "source"
+    create_structure(source_folder, {
+        f'file{index}.md': f'Paragraph {index}.' for index in range(10)
+        })
+    markdown_translator.config(include_files=[], exclude_files=[], keep_clean=False)
+    runs = {
+        "fr": markdown_translator.config.snapshot(
+                    dest_lang=["fr"], versioning="json", translation_engine="disabled"),
+        "es": markdown_translator.config.snapshot(
+                    dest_lang=["es"], versioning="sql", translation_engine="disabled"),
+    }
+    # Global settings changes do not affect snapshots
+    markdown_translator.config(exclude_files=["file0.md"])
+    try:
+        threads = [threading.Thread(target=RepositoryTranslator(
+                        source_folder, tmp_path / lang, settings).update)
+                    for lang, settings in runs.items()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        markdown_translator.config(exclude_files=[])
+
+    expected_files = {f'file{index}.md': f'Paragraph {index}.' for index in range(10)}
+    assert convert_to_dict(tmp_path / "fr")['fr'] == expected_files
+    assert convert_to_dict(tmp_path / "es")['es'] == expected_files
+    assert sorted(path.name for path in (tmp_path / "fr").iterdir()) == ["fr", "hashes.json"]
+    assert sorted(path.name for path in (tmp_path / "es").iterdir()) == ["es", "hashes.db"]
+
+@disable_translation
+def test_repo_translator_instrumentation(tmp_path):
+    source_folder = tmp_path / "source"
+    create_structure(source_folder, {
+        'first.md': '# Title\n\n[Link](/page.md)',
+        'second.md': 'Paragraph.',
+        })
+    markdown_translator.config(
+                dest_lang=["fr", "es"],
+                include_files=[],
+                exclude_files=[],
+                keep_clean=False,
+                )
+    events = []
+    hook = lambda stage, duration, details: events.append((stage, details))
+    instrumentation.add_hook(hook)
+    try:
+        with instrumentation.collect() as timings:
+            RepositoryTranslator(source_folder, tmp_path / "destination").update()
+    finally:
+        instrumentation.remove_hook(hook)
+
+    summary = timings.summary()
+    assert {"plan_file", "standardize", "parse", "html_to_markdown",
+            "translate_unit", "translate", "edit_links", "write"} <= summary.keys()
+    assert summary["plan_file"]["count"] == 2
+    assert summary["translate_unit"]["count"] == 4
+    assert summary["translate"]["characters"] == summary["translate_unit"]["characters"] > 0
+    assert all(stats["total"] >= stats["max"] > 0 for stats in summary.values())
+    # Sizes of files and hashes read and written
+    assert summary["read"]["bytes"] >= sum(
+                path.stat().st_size for path in source_folder.iterdir())
+    assert summary["write"]["bytes"] == sum(
+                path.stat().st_size for path in (tmp_path / "destination").glob("*/*.md"))
+    assert summary["hashes.write"]["bytes"] > 0
+    assert ("translate_unit", {"file": "second.md", "lang": "es",
+            "characters": len("<p>Paragraph.</p>\n")}) in events
+    # Files are translated once found, not all planned first
+    assert [stage for stage, _ in events if stage in ("plan_file", "translate_unit")] \
+                == ["plan_file", "translate_unit", "translate_unit"] * 2
+
+    # Nothing is measured without hooks
+    events.clear()
+    assert instrumentation.stage("parse") is instrumentation.stage("write")
+    with instrumentation.stage("write") as measured:
+        measured.add(bytes=1)
+    RepositoryTranslator(source_folder, tmp_path / "destination").update()
+    assert events == []
+
+@disable_translation
+def test_repo_translator_report(tmp_path):
+    source_folder = tmp_path / "source"
+    create_structure(source_folder, {
+        'updated.md': '# Title\n\nNew paragraph.',
+        'not-updated.md': 'Still same paragraph.',
+        })
+    create_structure(tmp_path / "destination", {
+        'fr': {'updated.md': '# Title', 'not-updated.md': 'Still same paragraph.'},
+        })
+    report_path = tmp_path / "reports" / "report.json"
+    markdown_translator.config(
+                dest_lang=["fr"],
+                include_files=[],
+                exclude_files=[],
+                keep_clean=False,
+                report_path=str(report_path),
+                )
+    try:
+        RepositoryTranslator(source_folder, tmp_path / "destination").update()
+    finally:
+        markdown_translator.config(report_path="")
+
+    report = json.loads(report_path.read_text())
+    assert report["files_scanned"] == 2
+    assert report["languages"]["fr"] == {
+        "files_updated": 1,
+        "files_skipped": 1,
+        "files_postponed": 0,
+        "blocks_translated": 1,
+        "blocks_reused": 2,
+        "characters": len("<p>New paragraph.</p>\n"),
+        "requests": 1,
+    }
+    assert report["totals"]["requests"] == 1
+    assert {file["file"] for file in report["slowest_files"]} == \
+                {"updated.md", "not-updated.md"}
+    assert report["stages"]["translate"]["count"] == 1
+    assert report["caches"]["html_fragments"]["lookups"] > 0
+    assert report["duration"] > 0
+
+@disable_translation
+def test_repo_translator_profile(tmp_path):
+    source_folder = tmp_path / "source"
+    create_structure(source_folder, {'file.md': '# Title\n\nParagraph.'})
+    profile_path = tmp_path / "profile"
+    markdown_translator.config(
+                dest_lang=["fr"],
+                include_files=[],
+                exclude_files=[],
+                keep_clean=True,
+                profile_path=str(profile_path),
+                )
+    try:
+        RepositoryTranslator(source_folder, tmp_path / "destination").update()
+    finally:
+        markdown_translator.config(profile_path="")
+
+    stats = pstats.Stats(str(profile_path / "update.prof"))
+    assert stats.total_calls > 0
+    memory = json.loads((profile_path / "memory.json").read_text())
+    assert set(memory) == {"clean", "translate"}
+    assert all(usage["peak"] >= usage["start"] for usage in memory.values())
+    snapshot = tracemalloc.Snapshot.load(str(profile_path / "translate.snapshot"))
+    assert snapshot.statistics("filename")
+    assert not tracemalloc.is_tracing()
+
+    # A trace started by the caller is kept, with its peak
+    tracemalloc.start()
+    try:
+        allocated = bytearray(10 ** 7)
+        del allocated
+        markdown_translator.config(profile_path=str(profile_path))
+        RepositoryTranslator(source_folder, tmp_path / "destination").update()
+        assert tracemalloc.is_tracing()
+        assert tracemalloc.get_traced_memory()[1] >= 10 ** 7
+    finally:
+        markdown_translator.config(profile_path="")
+        tracemalloc.stop()
+
+@disable_translation
+def test_repo_translator_progress(tmp_path):
+    source_folder = tmp_path / "source"
+    create_structure(source_folder, {
+        'updated.md': '# Title\n\nNew paragraph.',
+        'not-updated.md': 'Still same paragraph.',
+        })
+    create_structure(tmp_path / "destination", {
+        'fr': {'updated.md': '# Title', 'not-updated.md': 'Still same paragraph.'},
+        })
+    markdown_translator.config(
+                dest_lang=["fr"],
+                include_files=[],
+                exclude_files=[],
+                keep_clean=False,
+                )
+    reports = []
+    RepositoryTranslator(source_folder, tmp_path / "destination").update(
+            progress=lambda progress: reports.append(progress.to_dict()))
+
+    started, finished = reports[0], reports[-1]
+    assert not started["finished"] and finished["finished"]
+    characters = len("<p>New paragraph.</p>\n")
+    # Files are counted before being compared with their translations
+    assert started["languages"]["fr"] == {
+        "files": 2, "files_done": 0,
+        "blocks": 0, "blocks_done": 0,
+        "characters": 0, "characters_done": 0,
+        "throughput": None, "eta": None,
+    }
+    language = finished["languages"]["fr"]
+    assert (language["files_done"], language["blocks_done"], language["characters_done"]) \
+                == (2, 1, characters)
+    assert language["throughput"] > 0
+    assert language["eta"] == finished["eta"] == 0
+    assert (language["blocks"], language["characters"]) == (1, characters)
+
+@disable_translation
+def test_repo_translator_progress_resumed(tmp_path):
+    source_folder = tmp_path / "source"
+    create_structure(source_folder, {'file.md': 'Some paragraph.'})
+    markdown_translator.config(
+                dest_lang=["fr", "es"],
+                include_files=[],
+                exclude_files=[],
+                keep_clean=False,
+                characters_budget=30,
+                )
+    repo = RepositoryTranslator(source_folder, tmp_path / "destination")
+    try:
+        plan = repo.update()
+    finally:
+        markdown_translator.config(characters_budget=0)
+    assert [unit.lang for unit in plan.pending] == ["es"]
+
+    # Only postponed units are tracked when the plan is resumed
+    reports = []
+    repo.update(plan=plan, progress=lambda progress: reports.append(progress.to_dict()))
+    assert list(reports[-1]["languages"]) == ["es"]
+    assert reports[-1]["languages"]["es"]["files_done"] == 1
+
+    progress = Progress(lambda progress: None)
+    progress.plan(plan.units[1:])
+    progress.advance(plan.units[0])
+    assert list(progress.languages) == ["es"]
+
+@disable_translation
+def test_repo_translator_metrics(tmp_path):
+    source_folder = tmp_path / "source"
+    create_structure(source_folder, {'file.md': '# Title\n\nParagraph.'})
+    metrics_path = tmp_path / "metrics" / "translator.prom"
+    markdown_translator.config(
+                dest_lang=["fr"],
+                include_files=[],
+                exclude_files=[],
+                keep_clean=False,
+                metrics_path=str(metrics_path),
+                )
+    try:
+        RepositoryTranslator(source_folder, tmp_path / "destination").update()
+        # Responses of the translator API, reported by adapters
+        metrics("translator.request", 0.2, {"engine": "deepl", "status": 429})
+        metrics("translator.request", 0.1, {"engine": "deepl", "status": 200})
+        translator_metrics = metrics.render()
+    finally:
+        markdown_translator.config(metrics_path="")
+        metrics.disable()
+        metrics.reset()
+
+    textfile = metrics_path.read_text()
+    characters = len("<h1>Title</h1>\n<p>Paragraph.</p>\n")
+    assert f'markdown_translator_characters_translated_total{{lang="fr"}} {characters}' \
+                in textfile
+    assert 'markdown_translator_translation_seconds_count{lang="fr"} 1' in textfile
+    assert 'markdown_translator_translation_seconds_bucket{lang="fr",le="+Inf"} 1' \
+                in textfile
+    assert 'markdown_translator_hashes_operation_seconds_count{operation="write"' in textfile
+    assert 'markdown_translator_cache_lookups_total{cache="html_fragments"}' in textfile
+    assert "# TYPE markdown_translator_converter_utilization gauge" in textfile
+    assert [path.name for path in metrics_path.parent.iterdir()] == ["translator.prom"]
+
+    assert 'translator_requests_total{engine="deepl",status="200"} 1' in translator_metrics
+    assert 'translator_errors_total{engine="deepl",status="429"} 1' in translator_metrics
+    assert 'translator_errors_total{engine="deepl",status="200"}' not in translator_metrics
+
+def test_paths_matcher():
+    matcher = PathsMatcher(["fr", "folder/file.md", "docs/sub"])
+    assert matcher.match(("fr",))
+    assert matcher.match(("docs", "fr", "file.md"))
+    assert matcher.match(("folder", "file.md"))
+    assert matcher.match(("root", "folder", "file.md"))
+    assert matcher.match(("docs", "sub", "file.md"))
+    assert not matcher.match(("file.md",))
+    assert not matcher.match(("folder", "other.md"))
+    assert not matcher.match(("sub", "docs", "file.md"))
+    assert not matcher.match(("french", "file.md"))
+
+    # Only the end of the path, parents being already controlled
+    assert matcher.match_end(("docs", "sub"))
+    assert not matcher.match_end(("docs", "sub", "file.md"))
+    assert not PathsMatcher([]).match(("file.md",))
+
+def test_walk_files(tmp_path):
+    test_structure = {
+        'file.md': '# Title',
+        'file.txt': 'Text',
+        'include.txt': 'Text',
+        'node_modules': {
+            'module.md': '# Module',
+            'deep': {'file.md': '# Deep'},
+        },
+        'docs': {
+            'page.md': '# Page',
+            'include.txt': 'Text',
+            'excluded.md': '# Excluded',
+        },
+    }
+    expected_files = {
+        Path("file.md"),
+        Path("include.txt"),
+        Path("docs/page.md"),
+        Path("docs/include.txt"),
+    }
+    create_structure(tmp_path, test_structure)
+
+    excluded = PathsMatcher(["node_modules", "docs/excluded.md"])
+    included = PathsMatcher(["include.txt"])
+    files = walk_files(tmp_path, excluded, included)
+    assert iter(files) is files
+    assert set(files) == expected_files
+
+def test_repo_translator_clean(tmp_path):
+    source_structure = {
+        'kept.md': '# Kept',
+        'subfolder': {
+            'kept.md': '# Kept',
+        },
+    }
+    old_structure = {
+        'fr': {
+            'kept.md': '# Kept',
+            'deleted.md': '# Deleted',
+            'other.txt': 'Not managed',
+            'subfolder': {
+                'kept.md': '# Kept',
+                'empty': {
+                    'deleted.md': '# Deleted',
+                },
+            },
+            'deleted-folder': {
+                'deleted.md': '# Deleted',
+            },
+        },
+        'es': {
+            'deleted.md': '# Deleted',
+        },
+    }
+    expected_structure = {
+        'hashes.db' : '...binary...',
+        'fr': {
+            'kept.md': '# Kept',
+            'other.txt': 'Not managed',
+            'subfolder': {
+                'kept.md': '# Kept',
+            },
+        },
+        'es': {},
+    }
+    source_folder = tmp_path / "source"
+    dest_folder = tmp_path / "destination"
+    create_structure(source_folder, source_structure)
+    create_structure(dest_folder, old_structure)
+
+    markdown_translator.config(
+                dest_lang=["fr", "es"],
+                include_files=[],
+                exclude_files=[],
+                )
+    repo = RepositoryTranslator(source_folder, dest_folder)
+    markdown_translator.adapters.hashes.set("kept.md", ["hash"])
+    markdown_translator.adapters.hashes.set("deleted.md", ["hash"])
+    repo._clean()
+
+    assert convert_to_dict(dest_folder) == expected_structure
+    assert markdown_translator.adapters.hashes.get("kept.md") == ["hash"]
+    assert markdown_translator.adapters.hashes.get("deleted.md") == None
+
+def git(folder, *args):
+    command = ["git", "-C", str(folder), "-c", "user.name=test",
+               "-c", "user.email=test@test", *args]
+    return subprocess.run(command, check=True, capture_output=True, text=True).stdout
+
+def test_repo_translator_git_changes(tmp_path):
+    source_structure = {
+        'modified.md': '# Title',
+        'deleted.md': '# Deleted',
+        'renamed.md': '# Renamed\n\n' + 'Long paragraph to keep similarity. ' * 10,
+        'moved.md': '# Moved\n\n' + 'Long paragraph to keep similarity. ' * 10,
+        'other.txt': 'Not managed',
+        'gone': {'nested.md': '# Nested'},
+    }
+    translated_structure = {
+        'fr': {
+            'modified.md': '# Titre',
+            'deleted.md': '# Supprimé',
+            'renamed.md': '# Renommé',
+            'moved.md': '# Déplacé',
+            'gone': {'nested.md': '# Imbriqué'},
+        },
+    }
+    expected_structure = {
+        'hashes.db' : '...binary...',
+        'fr': {
+            'modified.md': '# Titre',
+            'renamed-new.md': '# Renommé',
+            'folder': {
+                'moved.md': '# Déplacé',
+            },
+        },
+    }
+    source_folder = tmp_path / "source"
+    dest_folder = tmp_path / "destination"
+    create_structure(source_folder, source_structure)
+    create_structure(dest_folder, translated_structure)
+    git(source_folder, "init")
+    git(source_folder, "add", ".")
+    git(source_folder, "commit", "-m", "First version")
+
+    (source_folder / "modified.md").write_text("# Title modified\n")
+    (source_folder / "other.txt").write_text("Still not managed\n")
+    (source_folder / "folder").mkdir()
+    git(source_folder, "mv", "moved.md", "folder/moved.md")
+    git(source_folder, "mv", "renamed.md", "renamed-new.md")
+    git(source_folder, "rm", "deleted.md", "gone/nested.md")
+    git(source_folder, "commit", "-am", "Second version")
+
+    markdown_translator.config(dest_lang=["fr"], include_files=[], exclude_files=[])
+    repo = RepositoryTranslator(source_folder, dest_folder)
+    changes = repo._git_changes("HEAD~1", "HEAD")
+    assert sorted(changes) == [
+        ("=", Path("moved.md"), Path("folder/moved.md")),
+        ("=", Path("renamed.md"), Path("renamed-new.md")),
+        ("D", Path("deleted.md"), Path("deleted.md")),
+        ("D", Path("gone/nested.md"), Path("gone/nested.md")),
+        ("M", Path("modified.md"), Path("modified.md")),
+        ("M", Path("other.txt"), Path("other.txt")),
+    ]
+    # Revisions are never read as options
+    output = tmp_path / "output"
+    with pytest.raises(MarkdownTranslatorError):
+        repo._git_changes(f"--output={output}", "HEAD")
+    assert not output.exists()
+
+    # Renamed and deleted files are managed without translations
+    markdown_translator.adapters.hashes.set("renamed.md", ["hash"])
+    markdown_translator.adapters.hashes.set("deleted.md", ["hash"])
+    markdown_translator.adapters.hashes.set(partial_key("fr", "deleted.md"), ["hash"])
+    translated_files = []
+    repo._translate_file = translated_files.append
+    repo.update_changes("HEAD~1")
+
+    assert translated_files == [Path("modified.md")]
+    assert convert_to_dict(dest_folder) == expected_structure
+    assert markdown_translator.adapters.hashes.get("renamed-new.md") == ["hash"]
+    assert markdown_translator.adapters.hashes.get("renamed.md") == None
+    assert markdown_translator.adapters.hashes.get("deleted.md") == None
+    assert markdown_translator.adapters.hashes.get(partial_key("fr", "deleted.md")) == None
+
+@pytest.mark.parametrize("polling", [True, False])
+def test_repo_translator_watch(tmp_path, polling):
+    source_structure = {
+        'modified.md': '# Title',
+        'deleted.md': '# Deleted',
+        'fr': {'ignored.md': '# Ignored'},
+        'gone': {'nested.md': '# Nested'},
+    }
+    source_folder = tmp_path / "source"
+    dest_folder = tmp_path / "destination"
+    create_structure(source_folder, source_structure)
+    create_structure(dest_folder, {'fr': {
+        'deleted.md': '# Supprimé', 'gone': {'nested.md': '# Imbriqué'}}})
+
+    markdown_translator.config(dest_lang=["fr"], include_files=[], exclude_files=[])
+    repo = RepositoryTranslator(source_folder, dest_folder)
+    markdown_translator.adapters.hashes.set(partial_key("fr", "deleted.md"), ["hash"])
+    translated_files = []
+    def translate_file(relative_source):
+        if relative_source.name == "broken.md":
+            raise MarkdownTranslatorError("HTTP Error 456 on DeepL API")
+        translated_files.append(relative_source)
+    repo._translate_file = translate_file
+
+    stop = threading.Event()
+    watch_options = {"debounce": 0.2, "interval": 0.05, "polling": polling, "stop": stop}
+    watch_thread = threading.Thread(target=repo.watch, kwargs=watch_options)
+    watch_thread.start()
+    time.sleep(0.2)
+
+    # A burst of modifications is translated once
+    for number in range(3):
+        (source_folder / "modified.md").write_text(f"# Title {number}\n")
+        (source_folder / "fr" / "ignored.md").write_text(f"# Ignored {number}\n")
+        time.sleep(0.05)
+    # A failing file does not stop the watch
+    (source_folder / "broken.md").write_text("# Broken\n")
+    (source_folder / "subfolder").mkdir()
+    (source_folder / "subfolder" / "new.md").write_text("# New\n")
+    (source_folder / "deleted.md").unlink()
+    (source_folder / "gone" / "nested.md").unlink()
+
+    for _ in range(100):
+        if not (dest_folder / "fr" / "deleted.md").exists() and \
+                not (dest_folder / "fr" / "gone").exists():
+            break
+        time.sleep(0.05)
+    stop.set()
+    watch_thread.join()
+
+    assert sorted(translated_files) == [Path("modified.md"), Path("subfolder/new.md")]
+    assert not (dest_folder / "fr" / "deleted.md").exists()
+    assert not (dest_folder / "fr" / "gone").exists()
+    assert markdown_translator.adapters.hashes.get(partial_key("fr", "deleted.md")) == None
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify only")
+def test_inotify_watcher(tmp_path):
+    create_structure(tmp_path / "source", {
+        'file.md': '# File',
+        'folder': {'nested.md': '# Nested', 'sub': {'deep.md': '# Deep'}},
+    })
+    watcher = InotifyWatcher(tmp_path / "source", PathsMatcher([]), PathsMatcher([]))
+    try:
+        # Files of a directory moved out are reported, to delete translations
+        (tmp_path / "source" / "folder").rename(tmp_path / "moved")
+        assert watcher.changes(1) == {Path("folder/nested.md"), Path("folder/sub/deep.md")}
+
+        # Names which are not UTF-8 are kept as file system names
+        name = os.fsencode(tmp_path / "source") + b"/caf\xe9.md"
+        with open(name, "w") as file:
+            file.write("# Caf\n")
+        assert watcher.changes(1) == {Path(os.fsdecode(b"caf\xe9.md"))}
+
+        # Lost events: the folder is explored again, with deleted files
+        (tmp_path / "source" / "file.md").unlink()
+        watcher._read_events()
+        assert watcher._rescan() == {Path("file.md"), Path(os.fsdecode(b"caf\xe9.md"))}
+        assert watcher.files == {Path(os.fsdecode(b"caf\xe9.md"))}
+    finally:
+        watcher.close()
@@ -0,0 +1,177 @@
+import http.client
+import json
+import socket
+import threading
+import pytest
+from markdown_translator import config, instrumentation
+from markdown_translator.metrics import metrics
+from markdown_translator.server import create_server
+from utils_tests import *
+
+@pytest.fixture
+def server():
+    server = create_server(port=0)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+def request(server, method, path, content=None, headers=None):
+    host, port = server.server_address
+    connection = http.client.HTTPConnection(host, port)
+    body = content if isinstance(content, str) else json.dumps(content)
+    headers = {"Content-Type": "application/json", **(headers or {})}
+    connection.request(method, path, body=body if content is not None else None,
+                       headers=headers)
+    response = connection.getresponse()
+    result = response.status, json.loads(response.read())
+    connection.close()
+    return result
+
+def test_server_health(server):
+    assert request(server, "GET", "/health") == (200, {"status": "ok"})
+    assert request(server, "GET", "/unexisting")[0] == 404
+    assert request(server, "POST", "/unexisting", {})[0] == 404
+
+def test_server_metrics(server):
+    host, port = server.server_address
+    connection = http.client.HTTPConnection(host, port)
+    connection.request("GET", "/metrics")
+    response = connection.getresponse()
+    assert response.status == 200
+    assert response.getheader("Content-Type").startswith("text/plain")
+    assert "# TYPE markdown_translator_cache_lookups_total counter" in \
+                response.read().decode()
+    connection.close()
+    assert metrics.enabled
+
+def test_server_metrics_disabled():
+    # Metrics enabled by the service are disabled with it, from a new start
+    metrics.started = 0
+    server = create_server(port=0)
+    assert metrics.enabled and metrics.started > 0
+    server.server_close()
+    assert not metrics.enabled
+    assert instrumentation.stage("parse") is instrumentation.stage("write")
+
+def test_server_config(server):
+    status, content = request(server, "POST", "/config", {"urls_root": "/server"})
+    assert status == 200
+    assert config.URLS_ROOT == "/server"
+    config(urls_root="/")
+
+    # Invalid requests
+    assert request(server, "POST", "/config", {"unexisting": "value"})[0] == 400
+    assert request(server, "POST", "/config", "{invalid json")[0] == 400
+    assert request(server, "POST", "/translate", {"text": "# Title"})[0] == 400
+
+def test_server_security(tmp_path):
+    allowed = tmp_path / "allowed"
+    create_structure(allowed, {'source': {'file.md': '# Title'}})
+    server = create_server(port=0, token="secret", roots=[allowed])
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        authorization = {"Authorization": "Bearer secret"}
+        # Cross-origin simple requests cannot send a JSON Content-Type
+        assert request(server, "POST", "/config", {"keep_clean": True},
+                       {**authorization, "Content-Type": "text/plain"})[0] == 415
+        assert request(server, "POST", "/config", {"keep_clean": True})[0] == 401
+        assert request(server, "POST", "/config", {"keep_clean": True},
+                       {"Authorization": "Bearer wrong"})[0] == 401
+        # Rebinded domain names resolved to the service
+        assert request(server, "GET", "/health", None, {"Host": "evil.example:8787"})[0] == 403
+        assert request(server, "GET", "/health", None, {"Host": "localhost:8787"})[0] == 200
+
+        # Repositories only within the roots of the service
+        status, result = request(server, "POST", "/repository/update", {
+            "source": str(allowed / "source"), "destination": str(tmp_path / "outside")
+            }, authorization)
+        assert status == 400 and "outside of service roots" in result["error"]
+        assert not (tmp_path / "outside").exists()
+        # Files written by updates are not configured by clients
+        for setting in ("report_path", "metrics_path", "profile_path", "server_token"):
+            status, result = request(server, "POST", "/config",
+                                     {setting: str(tmp_path / "outside")}, authorization)
+            assert status == 400 and setting in result["error"]
+        assert config.REPORT_PATH == config.METRICS_PATH == config.PROFILE_PATH == ""
+
+        # Invalid arguments are client errors, internal failures are not
+        assert request(server, "POST", "/config", [], authorization)[0] == 400
+        assert request(server, "POST", "/config", {"unexisting": "value"}, authorization)[0] == 400
+        server.service.translate = lambda text, lang_to, lang_from=None: None + 1
+        assert request(server, "POST", "/translate", {"text": "", "lang_to": "fr"},
+                       authorization)[0] == 500
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+@disable_translation
+def test_server_repository_update(tmp_path, monkeypatch):
+    create_structure(tmp_path / "source", {'file.md': '# Title'})
+    (tmp_path / "cwd").mkdir()
+    monkeypatch.chdir(tmp_path / "cwd")
+    versioning = config.VERSIONING
+    config(dest_lang=["fr"], include_files=[], exclude_files=[], keep_clean=False,
+           versioning="sql")
+    server = create_server(port=0, roots=[tmp_path])
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        paths = {"source": str(tmp_path / "source"),
+                 "destination": str(tmp_path / "destination")}
+        assert request(server, "POST", "/repository/update", paths)[0] == 200
+        assert (tmp_path / "destination" / "hashes.db").exists()
+
+        # Stores selected by new settings belong to the destination
+        assert request(server, "POST", "/config", {"versioning": "json"})[0] == 200
+        (tmp_path / "source" / "file.md").write_text("# New title")
+        assert request(server, "POST", "/repository/update", paths)[0] == 200
+        assert (tmp_path / "destination" / "hashes.json").exists()
+        assert list((tmp_path / "cwd").iterdir()) == []
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+        config(versioning=versioning)
+
+def test_server_unix_socket(tmp_path):
+    socket_path = str(tmp_path / "translator.sock")
+    server = create_server(unix_socket=socket_path)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(socket_path)
+    client.sendall(b"GET /health HTTP/1.0\r\n\r\n")
+    answer = b""
+    while data := client.recv(4096):
+        answer += data
+    client.close()
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+    assert answer.startswith(b"HTTP/1.0 200")
+    assert answer.endswith(b'{"status": "ok"}')
+
+@disable_translation
+def test_server_translate(server):
+    config(edit_links=True, urls_root="/", dest_lang=[])
+    content = {"text": "# Title\n\nA [link](/page).", "lang_to": "fr"}
+    status, result = request(server, "POST", "/translate", content)
+    assert status == 200
+    assert result == {"markdown": "# Title\n\nA [link](/fr/page)."}
+
+    content = {
+        "translation": result["markdown"],
+        "hashes": ["8b94a4b3cda7a3c5e1cd33f3a3bce7f1", "unknown"],
+        "new_version": "# Title\n\nA [link](/page).\n\nNew paragraph.",
+        "lang_to": "fr",
+    }
+    status, result = request(server, "POST", "/update", content)
+    assert status == 200
+    assert result["markdown"].endswith("New paragraph.")
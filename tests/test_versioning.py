@@ -229,3 +229,41 @@ Second title updated
             directory=dest_folder / lang,
             restore_hashes=True)
     assert translated_md.blocks.childrens == expected_blocks
+
+@disable_translation
+@pytest.mark.parametrize("mode", adapters.hashes.options - {"disabled"})
+def test_versioning_sentences(tmp_path, create_markdown_file, mode):
+    adapters.hashes.select(mode, tmp_path)
+    markdown_translator.config(split_sentences=True, edit_links=False)
+
+    update_content = """
+# First title
+
+First sentence. Second sentence updated! Third `code. inline` sentence.
+    """
+    backup_translation = {
+        "378cc1d0bb9779ff6c7ee1bffae4571b": "# First title [translated]",
+    }
+    backup_sentences = {
+        "58b5e6cc7bcc9ce15b04e212dbc1bdae": "First sentence [translated].",
+        "606c9d14ad2e689cdfcc4b72d6655f7e": "Third `code. inline` sentence [translated].",
+    }
+    expected_blocks = {
+        "378cc1d0bb9779ff6c7ee1bffae4571b": "# First title [translated]",
+        "b1d50af3f2b63bccd6847bdd9f40faf7": "First sentence [translated]. " \
+            "Second sentence updated! Third `code. inline` sentence [translated].",
+    }
+
+    translation_path = create_markdown_file("\n\n".join(backup_translation.values()))
+    adapters.hashes.set(translation_path, list(backup_translation.keys()))
+    adapters.hashes.set_sentences("fr", backup_sentences)
+
+    translated_md = Markdown(filename=translation_path, restore_hashes=True)
+    new_version = Markdown(text=update_content)
+
+    translated_md.update(new_version, lang_to="fr", lang_from="en")
+    markdown_translator.config(split_sentences=False, edit_links=True)
+
+    assert translated_md.blocks.childrens == expected_blocks
+    assert adapters.hashes.get_sentence("fr", "83ab308bbaa1c58b41772204eced7240") \
+                                                    == "Second sentence updated!"